@@ -1,18 +1,28 @@
 import os
-from flask import Flask, request, jsonify, send_file, session
+from flask import Flask, request, jsonify, send_file, session, Response
 from flask_cors import CORS
 from docx import Document
 import PyPDF2
 import io
 import re
+import csv
 import json
+import zlib
 from datetime import datetime, timedelta
-from difflib import SequenceMatcher
+import math
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import defaultdict, OrderedDict
+from itertools import chain
 import threading
 import time
+import queue
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 import requests
+from requests.adapters import HTTPAdapter
 from dataclasses import dataclass
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable
 import uuid
 import sqlite3
 import hashlib
@@ -29,11 +39,54 @@ CORS(app, supports_credentials=True, origins=["*"])  # Allow all origins for tes
 # Stripe configuration using environment variables
 stripe.api_key = os.environ.get('STRIPE_API_KEY', 'sk_test_your_stripe_secret_key_here')
 STRIPE_PUBLISHABLE_KEY = os.environ.get('STRIPE_PUBLISHABLE_KEY', 'pk_test_your_stripe_publishable_key_here')
+# No default: a well-known placeholder secret would let anyone forge credit events
+STRIPE_WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', '')
+STRIPE_WEBHOOK_SECRET_PLACEHOLDER = 'whsec_your_webhook_secret_here'
+
+# Point the SDK at a local mock server (see mock_stripe_server.py) for testing
+stripe.api_base = os.environ.get('STRIPE_API_BASE', stripe.api_base)
+
+# Outbound Stripe calls share one pooled session with bounded timeouts so a slow
+# Stripe response cannot hold a request worker indefinitely
+STRIPE_CONNECT_TIMEOUT = float(os.environ.get('STRIPE_CONNECT_TIMEOUT', 3))
+STRIPE_READ_TIMEOUT = float(os.environ.get('STRIPE_READ_TIMEOUT', 10))
+_stripe_session = requests.Session()
+_stripe_adapter = HTTPAdapter(pool_connections=4, pool_maxsize=int(os.environ.get('STRIPE_POOL_SIZE', 10)))
+_stripe_session.mount('https://', _stripe_adapter)
+_stripe_session.mount('http://', _stripe_adapter)
+stripe.default_http_client = stripe.RequestsClient(
+    timeout=(STRIPE_CONNECT_TIMEOUT, STRIPE_READ_TIMEOUT),
+    session=_stripe_session
+)
+stripe.max_network_retries = 2
 
 # Database configuration
 DATABASE_PATH = os.environ.get('DATABASE_PATH', 'doc_checker.db')
 
 # Database initialization
+def resolve_duplicate_payment_intents(c):
+    """Detach repeated PaymentIntent rows so the unique index can be built.
+
+    Databases from before webhook crediting may record one PaymentIntent
+    more than once. The earliest row keeps the id; later rows keep their
+    amount for the audit trail but are marked 'duplicate' and logged.
+    """
+    c.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = 'idx_transactions_payment_intent'")
+    if c.fetchone():
+        return
+    
+    c.execute('''SELECT t.id, t.user_id, t.amount, t.stripe_payment_intent_id FROM transactions t
+                 JOIN (SELECT stripe_payment_intent_id, MIN(id) AS keep_id FROM transactions
+                       WHERE stripe_payment_intent_id IS NOT NULL
+                       GROUP BY stripe_payment_intent_id HAVING COUNT(*) > 1) d
+                 ON t.stripe_payment_intent_id = d.stripe_payment_intent_id AND t.id != d.keep_id''')
+    for transaction_id, user_id, amount, payment_intent_id in c.fetchall():
+        app.logger.warning('Transaction %s duplicates PaymentIntent %s (user %s, amount %s); marked as duplicate',
+                           transaction_id, payment_intent_id, user_id, amount)
+        c.execute('''UPDATE transactions SET stripe_payment_intent_id = NULL, status = 'duplicate',
+                     description = COALESCE(description, '') || ' [duplicate of PaymentIntent ' || ? || ']'
+                     WHERE id = ?''', (payment_intent_id, transaction_id))
+
 def init_database():
     conn = sqlite3.connect(DATABASE_PATH)
     c = conn.cursor()
@@ -77,6 +130,15 @@ def init_database():
                     FOREIGN KEY (user_id) REFERENCES users (id)
                 )''')
     
+    # A PaymentIntent may only ever be credited once, however often Stripe delivers it
+    resolve_duplicate_payment_intents(c)
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_payment_intent
+                 ON transactions (stripe_payment_intent_id)
+                 WHERE stripe_payment_intent_id IS NOT NULL''')
+    
+    # Per-user time ordering for history listings and exports
+    c.execute('CREATE INDEX IF NOT EXISTS idx_transactions_user_time ON transactions (user_id, timestamp)')
+    
     # Analysis history table
     c.execute('''CREATE TABLE IF NOT EXISTS analysis_history (
                     id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -90,6 +152,7 @@ def init_database():
                     report_generated BOOLEAN DEFAULT FALSE,
                     FOREIGN KEY (user_id) REFERENCES users (id)
                 )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_analysis_history_user_time ON analysis_history (user_id, timestamp)')
     
     # Monitored documents table (per user)
     c.execute('''CREATE TABLE IF NOT EXISTS monitored_documents (
@@ -116,6 +179,196 @@ PRICING = {
     'subscription_yearly': 299.99
 }
 
+# Detection budgets per subscription tier; None leaves a limit unbounded.
+# Override with a JSON object in DETECTION_BUDGETS, e.g. {"free": {"max_seconds": 5}}
+DETECTION_BUDGETS = {
+    'free': {'max_seconds': 10, 'max_pairs': 100000, 'max_phrases_per_doc': 500, 'max_sections_per_doc': 200},
+    'monthly': {'max_seconds': 30, 'max_pairs': 500000, 'max_phrases_per_doc': 2000, 'max_sections_per_doc': 500},
+    'yearly': {'max_seconds': 60, 'max_pairs': 2000000, 'max_phrases_per_doc': 5000, 'max_sections_per_doc': 1000}
+}
+for tier, limits in json.loads(os.environ.get('DETECTION_BUDGETS', '{}')).items():
+    DETECTION_BUDGETS.setdefault(tier, dict(DETECTION_BUDGETS['free'])).update(limits)
+
+MAX_CONTRADICTIONS = 15
+
+# Admission control for expensive routes, per worker process. Running plus
+# queued analyses never exceed GUNICORN_THREADS - ADMISSION_RESERVED_THREADS,
+# so the reserved threads stay free for lightweight routes like /health.
+ADMISSION_GLOBAL_LIMIT = int(os.environ.get('ADMISSION_GLOBAL_LIMIT', 4))
+ADMISSION_PER_USER_LIMIT = int(os.environ.get('ADMISSION_PER_USER_LIMIT', 2))
+ADMISSION_PER_USER_QUEUE = int(os.environ.get('ADMISSION_PER_USER_QUEUE', 2))
+ADMISSION_QUEUE_SIZE = int(os.environ.get('ADMISSION_QUEUE_SIZE', 8))
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 10))
+ADMISSION_WORKER_THREADS = int(os.environ.get('GUNICORN_THREADS', 16))
+ADMISSION_RESERVED_THREADS = int(os.environ.get('ADMISSION_RESERVED_THREADS', 4))
+
+# Result cache for repeated uploads of the same document set
+RESULT_CACHE_TTL = float(os.environ.get('RESULT_CACHE_TTL', 3600))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 256))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Fraction of the per-document price charged when a result is served from cache
+RESULT_CACHE_HIT_PRICE_FACTOR = float(os.environ.get('RESULT_CACHE_HIT_PRICE_FACTOR', 1.0))
+
+# Export configuration
+EXPORT_BATCH_SIZE = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+EXPORT_TABLES = {
+    'transactions': ['id', 'transaction_type', 'amount', 'description', 'timestamp',
+                     'payment_method', 'stripe_payment_intent_id', 'status'],
+    'analysis-history': ['id', 'analysis_id', 'session_id', 'documents_count', 'contradictions_found',
+                         'cost', 'timestamp', 'report_generated']
+}
+
+# Ledger configuration
+LEDGER_GROUP_COMMIT = os.environ.get('LEDGER_GROUP_COMMIT', '1') != '0'
+LEDGER_MAX_WAIT_MS = float(os.environ.get('LEDGER_MAX_WAIT_MS', 5))
+LEDGER_MAX_BATCH = int(os.environ.get('LEDGER_MAX_BATCH', 64))
+LEDGER_WRITE_TIMEOUT = float(os.environ.get('LEDGER_WRITE_TIMEOUT', 30))
+
+class LedgerWriter:
+    """Applies billing writes from concurrent requests as group commits.
+
+    SQLite allows a single writer, so rather than every request taking the
+    write lock and paying for its own fsync, events are queued and a
+    background thread commits everything that arrives within a short window
+    in one transaction. Each event runs in its own savepoint, so a failing
+    event is rolled back without affecting the rest of its group. Callers
+    wait on the returned Future, which resolves only after the commit.
+    """
+    
+    def __init__(self, db_path, max_wait_ms=5, max_batch=64, enabled=True):
+        self.db_path = db_path
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch = max_batch
+        self.enabled = enabled
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._events = 0
+        self._commits = 0
+    
+    def submit(self, statements):
+        """Queue a list of (sql, params) statements to be applied atomically."""
+        future = Future()
+        
+        if not self.enabled:
+            try:
+                self._apply_direct(statements)
+                future.set_result(None)
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        
+        self._ensure_started()
+        self._queue.put((statements, future))
+        return future
+    
+    def write(self, statements, timeout=None):
+        """Submit statements and block until they are committed.
+
+        If the write is still queued after the timeout it is cancelled and
+        never applied, and TimeoutError is raised. Once the writer has taken
+        it into a transaction it can no longer be withdrawn, so the caller
+        waits for the outcome instead.
+        """
+        future = self.submit(statements)
+        try:
+            return future.result(timeout or LEDGER_WRITE_TIMEOUT)
+        except FutureTimeoutError:
+            if future.cancel():
+                raise
+            return future.result()
+    
+    def stats(self):
+        with self._stats_lock:
+            return {
+                'events': self._events,
+                'commits': self._commits,
+                'queue_depth': self._queue.qsize()
+            }
+    
+    def _record(self, events):
+        with self._stats_lock:
+            self._events += events
+            self._commits += 1
+    
+    def _ensure_started(self):
+        # Started lazily so each gunicorn worker gets its own writer after fork
+        if self._thread and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if not self._thread or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='ledger-writer', daemon=True)
+                self._thread.start()
+    
+    def _apply_direct(self, statements):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            c = conn.cursor()
+            for sql, params in statements:
+                c.execute(sql, params)
+            conn.commit()
+        finally:
+            conn.close()
+        self._record(1)
+    
+    def _run(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            
+            self._commit_batch(conn, batch)
+    
+    def _commit_batch(self, conn, batch):
+        # Events whose callers gave up waiting are dropped, not committed
+        batch = [(statements, future) for statements, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        outcomes = []
+        
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for statements, future in batch:
+                conn.execute('SAVEPOINT ledger_event')
+                try:
+                    for sql, params in statements:
+                        conn.execute(sql, params)
+                    conn.execute('RELEASE ledger_event')
+                    outcomes.append((future, None))
+                except Exception as e:
+                    conn.execute('ROLLBACK TO ledger_event')
+                    conn.execute('RELEASE ledger_event')
+                    outcomes.append((future, e))
+            conn.execute('COMMIT')
+        except Exception as e:
+            try:
+                conn.execute('ROLLBACK')
+            except sqlite3.Error:
+                pass
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        
+        self._record(len(batch))
+        for future, error in outcomes:
+            if error:
+                future.set_exception(error)
+            else:
+                future.set_result(None)
+
+ledger_writer = LedgerWriter(DATABASE_PATH, LEDGER_MAX_WAIT_MS, LEDGER_MAX_BATCH, LEDGER_GROUP_COMMIT)
+
 # JWT token management
 def generate_token(user_id):
     payload = {
@@ -153,6 +406,131 @@ def require_auth(f):
     
     return decorated_function
 
+# Admission control
+class AdmissionRejected(Exception):
+    def __init__(self, status, reason, message, retry_after):
+        super().__init__(message)
+        self.status = status
+        self.reason = reason
+        self.message = message
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """Per-user and global concurrency limits with a bounded wait queue.
+
+    A request runs immediately if both its user and the process are under
+    their limits, otherwise it waits up to queue_timeout for a slot. A user
+    who already has per_user_queue requests waiting gets a 429, and a full
+    queue or an expired wait gets a 503; both carry a Retry-After estimate
+    based on the recent average service time.
+    """
+    
+    def __init__(self, global_limit, per_user_limit, per_user_queue, queue_size, queue_timeout,
+                 worker_threads, reserved_threads):
+        capacity = max(1, worker_threads - reserved_threads)
+        self.global_limit = max(1, min(global_limit, capacity))
+        self.per_user_limit = per_user_limit
+        self.per_user_queue = per_user_queue
+        self.queue_size = max(0, min(queue_size, capacity - self.global_limit))
+        self.queue_timeout = queue_timeout
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = 0
+        self._user_active = defaultdict(int)
+        self._user_waiting = defaultdict(int)
+        self._service_time = 1.0
+        self._admitted = 0
+        self._rejected = defaultdict(int)
+    
+    def _can_run(self, user_id):
+        return self._active < self.global_limit and self._user_active[user_id] < self.per_user_limit
+    
+    def _retry_after(self):
+        return max(1, math.ceil(self._service_time * (self._waiting + 1) / self.global_limit))
+    
+    def _reject(self, status, reason, message):
+        self._rejected[reason] += 1
+        raise AdmissionRejected(status, reason, message, self._retry_after())
+    
+    def acquire(self, user_id):
+        with self._cond:
+            if not self._can_run(user_id):
+                if self._user_waiting[user_id] >= self.per_user_queue:
+                    self._reject(429, 'user_limit', 'Too many concurrent analyses for this account')
+                if self._waiting >= self.queue_size:
+                    self._reject(503, 'queue_full', 'Server is busy, please retry shortly')
+                
+                self._waiting += 1
+                self._user_waiting[user_id] += 1
+                deadline = time.monotonic() + self.queue_timeout
+                try:
+                    while not self._can_run(user_id):
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._reject(503, 'queue_timeout', 'Server is busy, please retry shortly')
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+                    self._user_waiting[user_id] -= 1
+                    if not self._user_waiting[user_id]:
+                        del self._user_waiting[user_id]
+            
+            self._active += 1
+            self._user_active[user_id] += 1
+            self._admitted += 1
+    
+    def release(self, user_id, elapsed):
+        with self._cond:
+            self._active -= 1
+            self._user_active[user_id] -= 1
+            if not self._user_active[user_id]:
+                del self._user_active[user_id]
+            self._service_time = 0.8 * self._service_time + 0.2 * elapsed
+            self._cond.notify_all()
+    
+    def stats(self):
+        with self._cond:
+            return {
+                'active': self._active,
+                'queue_depth': self._waiting,
+                'admitted': self._admitted,
+                'rejected': dict(self._rejected),
+                'avg_service_seconds': round(self._service_time, 3),
+                'limits': {
+                    'global': self.global_limit,
+                    'per_user': self.per_user_limit,
+                    'per_user_queue': self.per_user_queue,
+                    'queue_size': self.queue_size,
+                    'queue_timeout': self.queue_timeout
+                }
+            }
+
+admission_controller = AdmissionController(ADMISSION_GLOBAL_LIMIT, ADMISSION_PER_USER_LIMIT, ADMISSION_PER_USER_QUEUE,
+                                           ADMISSION_QUEUE_SIZE, ADMISSION_QUEUE_TIMEOUT,
+                                           ADMISSION_WORKER_THREADS, ADMISSION_RESERVED_THREADS)
+
+# Admission decorator, applied after require_auth on expensive routes
+def admission_controlled(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        user_id = request.current_user_id
+        try:
+            admission_controller.acquire(user_id)
+        except AdmissionRejected as e:
+            return jsonify({
+                'error': e.message,
+                'reason': e.reason,
+                'retry_after': e.retry_after
+            }), e.status, {'Retry-After': str(e.retry_after)}
+        
+        started = time.monotonic()
+        try:
+            return f(*args, **kwargs)
+        finally:
+            admission_controller.release(user_id, time.monotonic() - started)
+    
+    return decorated_function
+
 # User management functions
 def hash_password(password):
     return hashlib.sha256(password.encode()).hexdigest()
@@ -201,14 +579,11 @@ def get_user_usage(user_id):
         'session_start': datetime.now().isoformat()
     }
 
-def update_user_billing(user_id, documents_count, generate_report_flag=False):
-    doc_cost = documents_count * PRICING['per_document']
+def update_user_billing(user_id, documents_count, generate_report_flag=False, price_factor=1.0, cache_hit=False):
+    doc_cost = documents_count * PRICING['per_document'] * price_factor
     report_cost = PRICING['per_report'] if generate_report_flag else 0
     total_cost = doc_cost + report_cost
     
-    conn = sqlite3.connect(DATABASE_PATH)
-    c = conn.cursor()
-    
     # Get current session
     session_data = get_current_session(user_id)
     if not session_data:
@@ -218,36 +593,42 @@ def update_user_billing(user_id, documents_count, generate_report_flag=False):
         session_id = session_data[0]
     
     # Update current session usage
-    c.execute('''UPDATE user_sessions 
-                 SET documents_processed = documents_processed + ?,
-                     reports_generated = reports_generated + ?,
-                     total_billing = total_billing + ?,
-                     last_activity = CURRENT_TIMESTAMP
-                 WHERE user_id = ? AND session_id = ?''', 
-              (documents_count, 1 if generate_report_flag else 0, total_cost, user_id, session_id))
+    statements = [
+        ('''UPDATE user_sessions 
+            SET documents_processed = documents_processed + ?,
+                reports_generated = reports_generated + ?,
+                total_billing = total_billing + ?,
+                last_activity = CURRENT_TIMESTAMP
+            WHERE user_id = ? AND session_id = ?''',
+         (documents_count, 1 if generate_report_flag else 0, total_cost, user_id, session_id))
+    ]
     
     # Add transaction records
     if documents_count > 0:
-        c.execute('''INSERT INTO transactions 
-                     (user_id, transaction_type, amount, description) 
-                     VALUES (?, ?, ?, ?)''', 
-                  (user_id, 'document_analysis', doc_cost, f'Analyzed {documents_count} documents'))
+        statements.append(('''INSERT INTO transactions 
+                              (user_id, transaction_type, amount, description) 
+                              VALUES (?, ?, ?, ?)''',
+                           (user_id, 'document_analysis', doc_cost,
+                            f'Analyzed {documents_count} documents' + (' (cached result)' if cache_hit else ''))))
     
     if generate_report_flag:
-        c.execute('''INSERT INTO transactions 
-                     (user_id, transaction_type, amount, description) 
-                     VALUES (?, ?, ?, ?)''', 
-                  (user_id, 'report_generation', report_cost, 'Generated detailed report'))
+        statements.append(('''INSERT INTO transactions 
+                              (user_id, transaction_type, amount, description) 
+                              VALUES (?, ?, ?, ?)''',
+                           (user_id, 'report_generation', report_cost, 'Generated detailed report')))
     
     # Record analysis in history
     analysis_id = str(uuid.uuid4())
-    c.execute('''INSERT INTO analysis_history 
-                 (user_id, session_id, analysis_id, documents_count, cost, report_generated) 
-                 VALUES (?, ?, ?, ?, ?, ?)''',
-              (user_id, session_id, analysis_id, documents_count, total_cost, generate_report_flag))
+    statements.append(('''INSERT INTO analysis_history 
+                          (user_id, session_id, analysis_id, documents_count, cost, report_generated) 
+                          VALUES (?, ?, ?, ?, ?, ?)''',
+                       (user_id, session_id, analysis_id, documents_count, total_cost, generate_report_flag)))
     
-    conn.commit()
-    conn.close()
+    # Deduct from account balance
+    statements.append(('UPDATE users SET account_balance = account_balance - ? WHERE id = ?',
+                       (total_cost, user_id)))
+    
+    ledger_writer.write(statements)
     
     return {
         'documents_cost': doc_cost,
@@ -265,10 +646,52 @@ def get_account_balance(user_id):
     conn.close()
     return result[0] if result else 0.0
 
+def get_subscription_type(user_id):
+    conn = sqlite3.connect(DATABASE_PATH)
+    c = conn.cursor()
+    c.execute('SELECT subscription_type FROM users WHERE id = ?', (user_id,))
+    result = c.fetchone()
+    conn.close()
+    return result[0] if result and result[0] else 'free'
+
+def credit_stripe_payment(user_id, payment_intent_id, amount):
+    """Credit a succeeded PaymentIntent to the user's balance exactly once.
+
+    Returns True if the payment was credited by this call, False if it had
+    already been recorded, and None without recording anything if the user
+    does not exist, so the PaymentIntent can still be credited later.
+    """
+    conn = sqlite3.connect(DATABASE_PATH)
+    c = conn.cursor()
+    
+    c.execute('SELECT 1 FROM users WHERE id = ?', (user_id,))
+    if c.fetchone() is None:
+        conn.close()
+        return None
+    
+    c.execute('''INSERT OR IGNORE INTO transactions 
+                 (user_id, transaction_type, amount, description, payment_method, stripe_payment_intent_id) 
+                 VALUES (?, ?, ?, ?, ?, ?)''',
+              (user_id, 'payment', amount, 'Account top-up via Stripe', 'stripe', payment_intent_id))
+    credited = c.rowcount == 1
+    
+    if credited:
+        c.execute('UPDATE users SET account_balance = account_balance + ? WHERE id = ?',
+                  (amount, user_id))
+    
+    conn.commit()
+    conn.close()
+    return credited
+
 # Health check endpoint for deployment
 @app.route('/health', methods=['GET'])
 def health_check():
-    return jsonify({'status': 'healthy', 'timestamp': datetime.now().isoformat()})
+    return jsonify({
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'admission': admission_controller.stats(),
+        'result_cache': result_cache.stats()
+    })
 
 
 # Authentication endpoints
@@ -422,11 +845,51 @@ def create_payment_intent():
         
         return jsonify({
             'client_secret': intent.client_secret,
+            'payment_intent_id': intent.id,
             'amount': amount
         })
     except Exception as e:
         return jsonify({'error': str(e)}), 400
 
+@app.route('/stripe-webhook', methods=['POST'])
+def stripe_webhook():
+    # Fail closed when no real signing secret is configured
+    if not STRIPE_WEBHOOK_SECRET or STRIPE_WEBHOOK_SECRET == STRIPE_WEBHOOK_SECRET_PLACEHOLDER:
+        return jsonify({'error': 'Webhook signing secret is not configured'}), 503
+    
+    payload = request.get_data()
+    sig_header = request.headers.get('Stripe-Signature')
+    
+    if not sig_header:
+        return jsonify({'error': 'Missing Stripe-Signature header'}), 400
+    
+    try:
+        event = stripe.Webhook.construct_event(payload, sig_header, STRIPE_WEBHOOK_SECRET)
+    except ValueError:
+        return jsonify({'error': 'Invalid payload'}), 400
+    except stripe.SignatureVerificationError:
+        return jsonify({'error': 'Invalid signature'}), 400
+    
+    if event['type'] == 'payment_intent.succeeded':
+        intent = event['data']['object']
+        metadata = intent.get('metadata') or {}
+        
+        if metadata.get('type') == 'account_topup' and metadata.get('user_id'):
+            # Unusable events are acknowledged and logged; an error status
+            # would only make Stripe retry them
+            try:
+                user_id = int(metadata['user_id'])
+            except (TypeError, ValueError):
+                app.logger.error('PaymentIntent %s has invalid user_id %r; not credited',
+                                 intent['id'], metadata['user_id'])
+                return jsonify({'received': True})
+            
+            amount = intent['amount'] / 100  # Convert cents to dollars
+            if credit_stripe_payment(user_id, intent['id'], amount) is None:
+                app.logger.error('PaymentIntent %s is for unknown user %s; not credited', intent['id'], user_id)
+    
+    return jsonify({'received': True})
+
 @app.route('/confirm-payment', methods=['POST'])
 @require_auth
 def confirm_payment():
@@ -434,41 +897,30 @@ def confirm_payment():
     data = request.get_json()
     payment_intent_id = data.get('payment_intent_id')
     
-    try:
-        # Verify payment with Stripe
-        intent = stripe.PaymentIntent.retrieve(payment_intent_id)
-        
-        if intent.status == 'succeeded' and intent.metadata.get('user_id') == str(user_id):
-            amount = intent.amount / 100  # Convert cents to dollars
-            
-            conn = sqlite3.connect(DATABASE_PATH)
-            c = conn.cursor()
-            
-            # Update account balance
-            c.execute('UPDATE users SET account_balance = account_balance + ? WHERE id = ?',
-                      (amount, user_id))
-            
-            # Record transaction
-            c.execute('''INSERT INTO transactions 
-                         (user_id, transaction_type, amount, description, payment_method, stripe_payment_intent_id) 
-                         VALUES (?, ?, ?, ?, ?, ?)''',
-                      (user_id, 'payment', amount, f'Account top-up via Stripe', 'stripe', payment_intent_id))
-            
-            conn.commit()
-            conn.close()
-            
-            new_balance = get_account_balance(user_id)
-            
-            return jsonify({
-                'message': 'Payment successful',
-                'amount': amount,
-                'new_balance': new_balance
-            })
-        else:
-            return jsonify({'error': 'Payment verification failed'}), 400
-            
-    except Exception as e:
-        return jsonify({'error': str(e)}), 400
+    if not payment_intent_id:
+        return jsonify({'error': 'payment_intent_id is required'}), 400
+    
+    # Payments are credited by the Stripe webhook; this only reports local state
+    conn = sqlite3.connect(DATABASE_PATH)
+    c = conn.cursor()
+    c.execute('''SELECT amount FROM transactions 
+                 WHERE user_id = ? AND stripe_payment_intent_id = ?''',
+              (user_id, payment_intent_id))
+    row = c.fetchone()
+    conn.close()
+    
+    if not row:
+        return jsonify({
+            'status': 'pending',
+            'message': 'Payment has not been confirmed by Stripe yet'
+        }), 202
+    
+    return jsonify({
+        'status': 'succeeded',
+        'message': 'Payment successful',
+        'amount': row[0],
+        'new_balance': get_account_balance(user_id)
+    })
 
 @app.route('/transaction-history', methods=['GET'])
 @require_auth
@@ -499,6 +951,115 @@ def get_transaction_history():
     conn.close()
     return jsonify({'transactions': transactions})
 
+@app.route('/export/<table>', methods=['GET'])
+@require_auth
+def export_ledger(table):
+    user_id = request.current_user_id
+    
+    if table not in EXPORT_TABLES:
+        return jsonify({'error': f'Unknown export, expected one of: {", ".join(EXPORT_TABLES)}'}), 404
+    
+    export_format = request.args.get('format', 'csv').lower()
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    
+    try:
+        start = _parse_export_bound(request.args.get('start'))
+        end = _parse_export_bound(request.args.get('end'), end_of_day=True)
+    except ValueError:
+        return jsonify({'error': 'start and end must be ISO dates (YYYY-MM-DD) or timestamps'}), 400
+    
+    use_gzip = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    columns = EXPORT_TABLES[table]
+    rows = _iter_export_rows(table.replace('-', '_'), columns, user_id, start, end)
+    
+    if export_format == 'csv':
+        chunks = _csv_chunks(columns, rows)
+        mimetype = 'text/csv'
+    else:
+        chunks = _ndjson_chunks(columns, rows)
+        mimetype = 'application/x-ndjson'
+    
+    filename = f"{table}_{user_id}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{export_format}"
+    if use_gzip:
+        chunks = _gzip_chunks(chunks)
+        mimetype = 'application/gzip'
+        filename += '.gz'
+    
+    return Response(chunks, mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"',
+        'X-Accel-Buffering': 'no'
+    })
+
+def _parse_export_bound(value, end_of_day=False):
+    # Timestamps are stored as SQLite CURRENT_TIMESTAMP strings (YYYY-MM-DD HH:MM:SS)
+    if not value:
+        return None
+    if len(value) == 10:
+        day = datetime.strptime(value, '%Y-%m-%d')
+        if end_of_day:
+            day += timedelta(days=1)
+        return day.strftime('%Y-%m-%d %H:%M:%S')
+    return datetime.fromisoformat(value).strftime('%Y-%m-%d %H:%M:%S')
+
+def _iter_export_rows(table, columns, user_id, start, end):
+    """Yield a user's rows in (timestamp, id) order, one keyset page at a time.
+
+    Each page is a separate short query, so memory stays at one batch and no
+    read transaction is held open while a slow client drains the response.
+    """
+    conditions = ['user_id = ?']
+    params = [user_id]
+    if start:
+        conditions.append('timestamp >= ?')
+        params.append(start)
+    if end:
+        conditions.append('timestamp < ?')
+        params.append(end)
+    
+    query = (f"SELECT {', '.join(columns)} FROM {table} WHERE {' AND '.join(conditions)} "
+             f"AND (timestamp, id) > (?, ?) ORDER BY timestamp, id LIMIT ?")
+    timestamp_index = columns.index('timestamp')
+    last_key = ('', 0)
+    
+    conn = sqlite3.connect(DATABASE_PATH)
+    try:
+        while True:
+            c = conn.execute(query, params + [last_key[0], last_key[1], EXPORT_BATCH_SIZE])
+            batch = c.fetchall()
+            if not batch:
+                break
+            yield batch
+            last_key = (batch[-1][timestamp_index], batch[-1][0])
+            if len(batch) < EXPORT_BATCH_SIZE:
+                break
+    finally:
+        conn.close()
+
+def _csv_chunks(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _ndjson_chunks(columns, batches):
+    for batch in batches:
+        yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in batch)
+
+def _gzip_chunks(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31 writes a gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
 @app.route('/usage-stats', methods=['GET'])
 @require_auth
 def get_usage_stats():
@@ -556,28 +1117,70 @@ def get_monitored_docs():
     return jsonify(docs)
 
 # Document analysis code (existing code with user authentication)
-@dataclass
-class Contradiction:
-    id: str
-    doc1_name: str
-    doc2_name: str
-    doc1_text: str
-    doc2_text: str
-    conflict_type: str
-    explanation: str
-    suggestion: str
-    severity: str
+class ContradictionHit:
+    """A conflict found by the detector: document indexes into the request's
+    documents, the two PhraseFacts records and the rule's findings. Names
+    and the id are only filled in by serialize_contradictions()."""
+    __slots__ = ('doc1', 'doc2', 'phrase1', 'phrase2', 'conflict_type', 'explanation', 'suggestion', 'severity',
+                 'id')
+    
+    def __init__(self, doc1, doc2, phrase1, phrase2, result):
+        self.doc1 = doc1
+        self.doc2 = doc2
+        self.phrase1 = phrase1
+        self.phrase2 = phrase2
+        self.conflict_type = result['type']
+        self.explanation = result['explanation']
+        self.suggestion = result['suggestion']
+        self.severity = result['severity']
+        self.id = None
+    
+    def approximate_size(self):
+        return len(self.phrase1.text) + len(self.phrase2.text) + len(self.explanation) + len(self.suggestion) + 200
+
+def serialize_contradictions(hits, doc_names):
+    """Build the API representation of detector hits in one pass. Ids are
+    assigned the first time a hit is returned and kept from then on."""
+    contradictions = []
+    for hit in hits:
+        if hit.id is None:
+            hit.id = str(uuid.uuid4())
+        contradictions.append({
+            'id': hit.id,
+            'doc1_name': doc_names[hit.doc1],
+            'doc2_name': doc_names[hit.doc2],
+            'doc1_text': hit.phrase1.text,
+            'doc2_text': hit.phrase2.text,
+            'type': hit.conflict_type,
+            'explanation': hit.explanation,
+            'suggestion': hit.suggestion,
+            'severity': hit.severity
+        })
+    return contradictions
 
 def extract_text_from_docx(file_stream):
+    """Return a DOCX's text and its paragraphs as (line, heading_level,
+    explicit) entries for build_sections, using the paragraph styles."""
     try:
         document = Document(file_stream)
-        full_text = []
+        entries = []
         for para in document.paragraphs:
-            if para.text.strip():
-                full_text.append(para.text.strip())
-        return '\n'.join(full_text)
+            text = para.text.strip()
+            if not text:
+                continue
+            style_name = para.style.name if para.style is not None else ''
+            styled = DOCX_HEADING_PATTERN.match(style_name)
+            if styled:
+                entries.append((text, int(styled.group(1)), True))
+            elif style_name == 'Title':
+                entries.append((text, 0, True))
+            elif style_name.startswith('List'):
+                entries.append((text, None, False))
+            else:
+                entries.append((text, heading_level(text), False))
+        return '\n'.join(line for line, _, _ in entries), entries
     except Exception as e:
-        return f"Error reading DOCX: {str(e)}"
+        return f"Error reading DOCX: {str(e)}", []
 
 def extract_text_from_pdf(file_stream):
     try:
@@ -604,7 +1207,7 @@ def extract_text_from_file(file_stream, filename):
     filename_lower = filename.lower()
     
     if filename_lower.endswith('.docx'):
-        return extract_text_from_docx(file_stream)
+        return extract_text_from_docx(file_stream)[0]
     elif filename_lower.endswith('.pdf'):
         return extract_text_from_pdf(file_stream)
     elif filename_lower.endswith('.txt'):
@@ -612,6 +1215,104 @@ def extract_text_from_file(file_stream, filename):
     else:
         return "Unsupported file type"
 
+# Document structure
+# Extraction keeps a flat list of sections, each carrying its heading path, so
+# detection can compare clauses from matching sections only.
+@dataclass
+class Section:
+    title: str
+    level: int
+    path: tuple
+    lines: List[str]
+    
+    @property
+    def text(self):
+        return '\n'.join(self.lines)
+
+NUMBERED_HEADING_PATTERN = re.compile(r'^(?:(?:section|article|clause|part)\s+)?(\d+(?:\.\d+)*)[.)]?\s+(\S.*)$', re.IGNORECASE)
+DOCX_HEADING_PATTERN = re.compile(r'^heading\s*(\d+)$', re.IGNORECASE)
+TITLE_SMALL_WORDS = frozenset(['a', 'an', 'and', 'as', 'at', 'by', 'for', 'in', 'of', 'on', 'or', 'the', 'to', 'with'])
+
+def heading_level(line):
+    """Guess whether a plain-text line is a heading; returns its level or None."""
+    if not 3 <= len(line) <= 80 or line[-1] in '.!?;,':
+        return None
+    
+    numbered = NUMBERED_HEADING_PATTERN.match(line)
+    if numbered:
+        if len(numbered.group(2).split()) <= 10:
+            return numbered.group(1).count('.') + 1
+        return None
+    
+    words = line.rstrip(':').split()
+    if len(words) > 10:
+        return None
+    letters = [ch for ch in line if ch.isalpha()]
+    if letters and all(ch.isupper() for ch in letters):
+        return 1
+    if line.endswith(':'):
+        return 2
+    if len(words) <= 6 and all(not w[0].isalpha() or w[0].isupper() or w.lower() in TITLE_SMALL_WORDS for w in words):
+        return 2
+    return None
+
+def build_sections(entries):
+    """Group (line, heading_level, explicit) entries into sections.
+
+    Lines with a level start a new section under the nearest shallower
+    heading. A guessed heading directly under another heading is nested
+    below it, so "Team Standards:" followed by "Meetings:" reads as a path.
+    Heading lines stay in their section's text: a guessed heading may be a
+    clause itself ("1.1 Leave must be requested 5 days in advance"), and a
+    clause is content rather than a parent for the next heading.
+    """
+    sections = [Section('', 0, (), [])]
+    open_headings = []
+    heading_only = False
+    
+    for line, level, explicit in entries:
+        if level is None:
+            sections[-1].lines.append(line)
+            heading_only = False
+            continue
+        
+        current = sections[-1]
+        if not explicit and current.level and heading_only and level <= current.level:
+            level = current.level + 1
+        
+        title = line.rstrip(':').strip()
+        while open_headings and open_headings[-1][0] >= level:
+            open_headings.pop()
+        open_headings.append((level, title))
+        sections.append(Section(title, level, tuple(t for _, t in open_headings), [line]))
+        heading_only = not extract_key_phrases(line)
+    
+    return [section for section in sections if section.lines] or sections[:1]
+
+def sections_from_text(text, wrapped_lines=False):
+    # PDF text wraps mid-sentence, so only a line following a complete one
+    # can be a heading there
+    entries = []
+    previous_complete = True
+    for raw_line in text.split('\n'):
+        line = raw_line.strip()
+        if not line:
+            previous_complete = True
+            continue
+        level = heading_level(line) if previous_complete or not wrapped_lines else None
+        entries.append((line, level, False))
+        previous_complete = level is not None or line[-1] in '.!?:;'
+    return build_sections(entries)
+
+def extract_document(file_stream, filename):
+    """Extract a file's text together with its section outline."""
+    if filename.lower().endswith('.docx'):
+        text, entries = extract_text_from_docx(file_stream)
+        return {'text': text, 'sections': build_sections(entries) if entries else []}
+    
+    text = extract_text_from_file(file_stream, filename)
+    return {'text': text, 'sections': sections_from_text(text, wrapped_lines=filename.lower().endswith('.pdf'))}
+
 def extract_key_phrases(text):
     sentences = re.split(r'[.!?]+', text)
     
@@ -637,90 +1338,759 @@ def extract_key_phrases(text):
     
     return key_sentences
 
-def detect_contradictions_advanced(docs_data):
-    contradictions = []
-    seen_contradictions = set()
-    
-    doc_phrases = []
-    for doc in docs_data:
-        phrases = extract_key_phrases(doc['text'])
-        doc_phrases.append(phrases)
-    
-    for i in range(len(doc_phrases)):
-        for j in range(i + 1, len(doc_phrases)):
-            phrases_i = doc_phrases[i]
-            phrases_j = doc_phrases[j]
-            
-            for phrase_i in phrases_i:
-                for phrase_j in phrases_j:
-                    if SequenceMatcher(None, phrase_i.lower(), phrase_j.lower()).ratio() > 0.7:
-                        continue
-                    
-                    contradiction = analyze_contradiction(phrase_i, phrase_j)
-                    if contradiction:
-                        contradiction_key = tuple(sorted([phrase_i.lower(), phrase_j.lower()]))
-                        
-                        if contradiction_key not in seen_contradictions:
-                            seen_contradictions.add(contradiction_key)
-                            
-                            contradiction_obj = Contradiction(
-                                id=str(uuid.uuid4()),
-                                doc1_name=docs_data[i]['filename'],
-                                doc2_name=docs_data[j]['filename'],
-                                doc1_text=phrase_i,
-                                doc2_text=phrase_j,
-                                conflict_type=contradiction['type'],
-                                explanation=contradiction['explanation'],
-                                suggestion=contradiction['suggestion'],
-                                severity=contradiction['severity']
-                            )
-                            
-                            contradictions.append(contradiction_obj)
-    
-    return contradictions[:15]
+# Contradiction rules
+# Facts are extracted once per phrase and each rule declares the facts and
+# trigger keywords it needs, so a pair is only handed to rules that can apply.
+@dataclass
+class ContradictionRule:
+    name: str
+    requires: tuple
+    keywords: frozenset
+    check: Callable
+    sweep: bool = False
 
-def analyze_contradiction(phrase1, phrase2):
-    p1_lower = phrase1.lower()
-    p2_lower = phrase2.lower()
+class PhraseFacts:
+    """Facts for one key phrase, ordered like FACT_EXTRACTORS, and a bit per
+    applicable rule. key is set by the detector and shared by phrases with
+    the same lowercased text."""
+    __slots__ = ('text', 'values', 'rule_mask', 'key')
+    
+    def __init__(self, text, values, rule_mask, key=None):
+        self.text = text
+        self.values = values
+        self.rule_mask = rule_mask
+        self.key = key
+    
+    def fact(self, name):
+        return self.values[FACT_INDEX[name]]
+
+# Numeric facts
+# Quantities are normalised to a common base (durations to days, percentages
+# to fractions) and keep the bound they were stated with, so "2 weeks" and
+# "10 days" compare directly and "at least 5 days" is the interval [5, inf).
+# Months are a twelfth of a 365-day year, so "12 months" is "1 year"; since
+# calendar months and years vary in length, a duration in months or years
+# agrees with one in days or weeks within CALENDAR_SLACK_DAYS per unit
+# ("4 weeks" vs "1 month", "52 weeks" vs "1 year").
+PERCENTAGE_PATTERN = re.compile(r'(\d+(?:\.\d+)?)\s*(?:%|percent)')
+DURATION_PATTERN = re.compile(r'(\d+)\s*(days?|weeks?|months?|years?)\b')
+DURATION_UNIT_DAYS = {'day': 1, 'week': 7, 'month': 365 / 12, 'year': 365}
+CALENDAR_SLACK_DAYS = {'month': 2.5, 'year': 1.25}
+BOUND_PATTERN = re.compile(
+    r'\b(?:(?P<min>at least|minimum|min\.|no less than|not less than|more than|over|above|exceeding)'
+    r'|(?P<max>no more than|not more than|not be more than|up to|at most|maximum|max\.|not exceed|within|'
+    r'less than|under|below|capped at))(?:\s+of)?\s*$'
+)
+BOUND_WORDS = {'exact': '', 'min': 'at least ', 'max': 'no more than '}
+
+class NumericFact:
+    """A quantity normalised to value, stated as exactly that value ('exact'),
+    a lower bound ('min') or an upper bound ('max'). amount and unit are kept
+    as written for messages."""
+    __slots__ = ('value', 'bound', 'amount', 'unit')
+    
+    def __init__(self, value, bound, amount, unit):
+        self.value = value
+        self.bound = bound
+        self.amount = amount
+        self.unit = unit
+    
+    @property
+    def low(self):
+        return 0.0 if self.bound == 'max' else self.value
+    
+    @property
+    def high(self):
+        return math.inf if self.bound == 'min' else self.value
+    
+    def describe(self):
+        separator = '' if self.unit == '%' else ' '
+        return f'{BOUND_WORDS[self.bound]}{self.amount}{separator}{self.unit}'
+
+def numeric_bound(prefix):
+    match = BOUND_PATTERN.search(prefix.lower())
+    if not match:
+        return 'exact'
+    return 'min' if match.group('min') else 'max'
+
+def calendar_slack(fact1, fact2):
+    """How far apart two values may be and still agree: non-zero only
+    between a calendar duration (months, years) and a fixed one."""
+    unit1, unit2 = fact1.unit.rstrip('s'), fact2.unit.rstrip('s')
+    if (unit1 in CALENDAR_SLACK_DAYS) == (unit2 in CALENDAR_SLACK_DAYS):
+        return 0.0
+    calendar, unit = (fact1, unit1) if unit1 in CALENDAR_SLACK_DAYS else (fact2, unit2)
+    return calendar.amount * CALENDAR_SLACK_DAYS[unit]
+
+def numeric_conflict(fact1, fact2):
+    """'different' when both state the same kind of requirement with
+    different values, 'disjoint' when no value satisfies both, else None.
+    Values within calendar_slack() of each other are the same."""
+    slack = calendar_slack(fact1, fact2)
+    if fact1.bound == fact2.bound:
+        return 'different' if abs(fact1.value - fact2.value) > slack else None
+    if fact1.low > fact2.high + slack or fact2.low > fact1.high + slack:
+        return 'disjoint'
+    return None
+
+def _extract_percentage(phrase, phrase_lower):
+    match = PERCENTAGE_PATTERN.search(phrase)
+    if not match:
+        return None
+    amount = float(match.group(1))
+    return NumericFact(amount / 100, numeric_bound(phrase[:match.start()]), amount, '%')
+
+def _extract_duration(phrase, phrase_lower):
+    match = DURATION_PATTERN.search(phrase_lower)
+    if not match:
+        return None
+    amount, unit = int(match.group(1)), sys.intern(match.group(2))
+    return NumericFact(float(amount * DURATION_UNIT_DAYS[unit.rstrip('s')]),
+                       numeric_bound(phrase_lower[:match.start()]), amount, unit)
+
+FACT_EXTRACTORS = {
+    'percentage': _extract_percentage,
+    'duration': _extract_duration
+}
+FACT_INDEX = {name: index for index, name in enumerate(FACT_EXTRACTORS)}
+NO_FACTS = (None,) * len(FACT_EXTRACTORS)
+
+CONTRADICTION_RULES: List[ContradictionRule] = []
+SWEEP_RULE_MASK = 0
+_keyword_pattern = None
+_keyword_implies = {}
+
+def _build_keyword_matcher():
+    """Compile every rule keyword into a single multi-pattern scanner.
+
+    The lookahead finds the longest keyword starting at each position;
+    shorter keywords contained in it are added through _keyword_implies, so
+    the result matches a plain substring test for every keyword.
+    """
+    global _keyword_pattern, _keyword_implies
+    keywords = sorted({k for rule in CONTRADICTION_RULES for k in rule.keywords}, key=len, reverse=True)
+    if not keywords:
+        _keyword_pattern, _keyword_implies = None, {}
+        return
+    _keyword_pattern = re.compile('(?=(' + '|'.join(re.escape(k) for k in keywords) + '))')
+    _keyword_implies = {k: frozenset(other for other in keywords if other in k) for k in keywords}
+
+def contradiction_rule(requires=(), keywords=(), sweep=False):
+    """Register a rule that runs when both phrases have the required facts
+    and (if keywords are given) each contains at least one trigger keyword.
+
+    The detector offers a rule every topic-aligned pair it applies to. With
+    sweep=True it is only offered pairs the numeric fact sweep finds, i.e.
+    pairs where numeric_conflict() holds for some fact; use it only for
+    rules that report nothing otherwise.
+    """
+    if any(name not in FACT_EXTRACTORS for name in requires):
+        raise ValueError(f'Contradiction rules must require facts from {sorted(FACT_EXTRACTORS)}')
+    if sweep and not requires:
+        raise ValueError('Sweep rules must require at least one fact')
+    
+    def decorator(check):
+        global SWEEP_RULE_MASK
+        if sweep:
+            SWEEP_RULE_MASK |= 1 << len(CONTRADICTION_RULES)
+        CONTRADICTION_RULES.append(ContradictionRule(check.__name__, tuple(requires), frozenset(keywords), check, sweep))
+        _build_keyword_matcher()
+        return check
+    return decorator
+
+def extract_phrase_facts(phrase):
+    phrase_lower = phrase.lower()
+    values = tuple(extract(phrase, phrase_lower) for extract in FACT_EXTRACTORS.values())
+    if values == NO_FACTS:
+        values = NO_FACTS
+    
+    keywords = set()
+    if _keyword_pattern is not None:
+        for match in _keyword_pattern.finditer(phrase_lower):
+            keywords |= _keyword_implies[match.group(1)]
+    
+    rule_mask = 0
+    for bit, rule in enumerate(CONTRADICTION_RULES):
+        if any(values[FACT_INDEX[name]] is None for name in rule.requires):
+            continue
+        if rule.keywords and not (rule.keywords & keywords):
+            continue
+        rule_mask |= 1 << bit
+    
+    return PhraseFacts(phrase, values, rule_mask)
+
+def run_contradiction_rules(facts1, facts2, rules=-1):
+    # Only rules applicable to both phrases (and selected by the rules
+    # mask) are run, in registration order
+    mask = facts1.rule_mask & facts2.rule_mask & rules
+    bit = 0
+    while mask:
+        if mask & 1:
+            result = CONTRADICTION_RULES[bit].check(facts1, facts2)
+            if result:
+                return result
+        mask >>= 1
+        bit += 1
+    return None
+
+@contradiction_rule(requires=('percentage',), sweep=True)
+def percentage_conflict(facts1, facts2):
+    fact1, fact2 = facts1.fact('percentage'), facts2.fact('percentage')
+    conflict = numeric_conflict(fact1, fact2)
+    if conflict == 'different':
+        val1, val2 = fact1.amount, fact2.amount
+        severity = "High" if round(abs(fact1.value - fact2.value), 6) >= 0.1 else "Medium"
+        return {
+            'type': 'Percentage Conflict',
+            'explanation': f'Two documents specify different percentage requirements: {val1}% vs {val2}%. This creates ambiguity about which standard to follow.',
+            'suggestion': f'Standardize the percentage requirement. Consider using the higher value ({max(val1, val2)}%) for stricter compliance or clarify which document takes precedence.',
+            'severity': severity
+        }
+    if conflict == 'disjoint':
+        return {
+            'type': 'Percentage Conflict',
+            'explanation': f'Two documents set incompatible percentage requirements: {fact1.describe()} vs {fact2.describe()}. No value can satisfy both.',
+            'suggestion': 'Align the two limits so they overlap, or clarify which document takes precedence.',
+            'severity': "High"
+        }
+    return None
+
+@contradiction_rule(requires=('duration',), keywords=('day', 'week', 'month', 'year', 'notice', 'deadline', 'advance'),
+                    sweep=True)
+def time_period_conflict(facts1, facts2):
+    fact1, fact2 = facts1.fact('duration'), facts2.fact('duration')
+    conflict = numeric_conflict(fact1, fact2)
+    if conflict == 'different':
+        longer = fact1 if fact1.value > fact2.value else fact2
+        in_days = '' if fact1.unit.rstrip('s') == fact2.unit.rstrip('s') else f' ({round(fact1.value, 1):g} vs {round(fact2.value, 1):g} days)'
+        severity = "High" if abs(fact1.value - fact2.value) >= 7 else "Medium"
+        return {
+            'type': 'Time Period Conflict',
+            'explanation': f'Conflicting time requirements found: {fact1.amount} {fact1.unit} vs {fact2.amount} {fact2.unit}{in_days}. This could lead to confusion about actual deadlines.',
+            'suggestion': f'Establish a single, clear time requirement. Recommend using {longer.amount} {longer.unit} to ensure adequate time for compliance.',
+            'severity': severity
+        }
+    if conflict == 'disjoint':
+        return {
+            'type': 'Time Period Conflict',
+            'explanation': f'Incompatible time requirements found: {fact1.describe()} vs {fact2.describe()}. No single deadline can satisfy both.',
+            'suggestion': 'Align the two time limits so they overlap, or clarify which document takes precedence.',
+            'severity': "High"
+        }
+    return None
+
+# Result cache
+# Bump DETECTOR_VERSION whenever extraction or detection output changes so
+# cached results and client ETags from older code are no longer served.
+DETECTOR_VERSION = '5'
+
+def document_hash(filename, content):
+    extension = os.path.splitext(filename.lower())[1]
+    return hashlib.sha256(extension.encode('utf-8') + b'\0' + content).hexdigest()
+
+def analysis_key(content_hashes):
+    digest = hashlib.sha256('\n'.join(sorted(content_hashes)).encode('utf-8')).hexdigest()
+    return f'{DETECTOR_VERSION}-{digest[:40]}'
+
+ANALYSIS_KEY_PATTERN = re.compile(r'^(\d+)-[0-9a-f]{40}$')
+
+def is_analysis_key(key):
+    return ANALYSIS_KEY_PATTERN.match(key) is not None
+
+def analysis_key_is_current(key):
+    # Only says the key was issued by this detector version, not that the
+    # result is cached: the same documents would give the same result
+    match = ANALYSIS_KEY_PATTERN.match(key)
+    return match is not None and match.group(1) == DETECTOR_VERSION
+
+class ResultCache:
+    """In-process LRU of complete analysis results keyed by analysis_key().
+
+    Entries hold each document's extracted text, the detector's hits and
+    the content hashes their document indexes refer to, so a hit can be
+    served with the uploader's current filenames. Bounded by entry count,
+    approximate size in bytes and TTL.
+    """
+    
+    def __init__(self, ttl, max_entries, max_bytes):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and time.monotonic() - entry['stored_at'] > self.ttl:
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+    
+    def put(self, key, texts, doc_hashes, contradictions):
+        size = sum(len(text) for text in texts.values()) + sum(hit.approximate_size() for hit in contradictions)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                'texts': texts,
+                'doc_hashes': doc_hashes,
+                'contradictions': contradictions,
+                'size': size,
+                'stored_at': time.monotonic()
+            }
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
     
-    # Check for percentage conflicts
-    perc1 = re.search(r'(\d+(?:\.\d+)?)\s*(?:%|percent)', phrase1)
-    perc2 = re.search(r'(\d+(?:\.\d+)?)\s*(?:%|percent)', phrase2)
+    def _remove(self, key):
+        self._bytes -= self._entries.pop(key)['size']
     
-    if perc1 and perc2:
-        val1, val2 = float(perc1.group(1)), float(perc2.group(1))
-        if abs(val1 - val2) > 0:
-            severity = "High" if abs(val1 - val2) >= 10 else "Medium"
+    def stats(self):
+        with self._lock:
             return {
-                'type': 'Percentage Conflict',
-                'explanation': f'Two documents specify different percentage requirements: {val1}% vs {val2}%. This creates ambiguity about which standard to follow.',
-                'suggestion': f'Standardize the percentage requirement. Consider using the higher value ({max(val1, val2)}%) for stricter compliance or clarify which document takes precedence.',
-                'severity': severity
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self._hits,
+                'misses': self._misses
+            }
+
+result_cache = ResultCache(RESULT_CACHE_TTL, RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_BYTES)
+
+# Topic alignment
+# Key phrases are turned into sparse TF-IDF vectors over their subject words
+# (requirement boilerplate, units and numbers are dropped), and only pairs
+# whose cosine similarity clears the threshold are checked for conflicts.
+TOPIC_SIMILARITY_THRESHOLD = float(os.environ.get('TOPIC_SIMILARITY_THRESHOLD', 0.15))
+SECTION_SIMILARITY_THRESHOLD = float(os.environ.get('SECTION_SIMILARITY_THRESHOLD', 0.2))
+SECTION_BODY_SIMILARITY_THRESHOLD = float(os.environ.get('SECTION_BODY_SIMILARITY_THRESHOLD', 0.35))
+
+TOPIC_TOKEN_PATTERN = re.compile(r'[a-z]{3,}')
+TOPIC_STOPWORDS = frozenset('''
+    a an the and or of to in on at by for with from as is are be been being this that these those it its their
+    there all any each every either party parties who which what when where will would can could may might must
+    shall should required require requires requirement requirements minimum maximum least most more less than no
+    not up within before after during until per via into over under other such own same also only very new
+    day days week weeks month months year years hour hours minute minutes percent date
+'''.split())
+
+EMPTY_TOPIC_VECTOR = ((), array('d'))
+
+def topic_tokens(phrase_lower):
+    tokens = []
+    for word in TOPIC_TOKEN_PATTERN.findall(phrase_lower):
+        if word in TOPIC_STOPWORDS:
+            continue
+        # Light plural folding so "requests" and "request" share a term
+        if word.endswith('ies') and len(word) > 4:
+            word = word[:-3] + 'y'
+        elif word.endswith('s') and not word.endswith('ss') and len(word) > 3:
+            word = word[:-1]
+        tokens.append(word)
+    return tokens
+
+def build_topic_vectors(doc_phrases):
+    """Return L2-normalised TF-IDF vectors for every phrase, with document
+    frequencies taken over all phrases in the request. A vector is a
+    (terms, weights) pair: a tuple of term strings shared across the
+    request and an array of their weights."""
+    terms = {}
+    doc_tokens = [[[terms.setdefault(term, term) for term in topic_tokens(phrase.lower())] for phrase in phrases]
+                  for phrases in doc_phrases]
+    
+    document_frequency = defaultdict(int)
+    phrase_count = 0
+    for phrases in doc_tokens:
+        for tokens in phrases:
+            phrase_count += 1
+            for term in set(tokens):
+                document_frequency[term] += 1
+    
+    idf = {term: math.log((1 + phrase_count) / (1 + df)) + 1 for term, df in document_frequency.items()}
+    
+    doc_vectors = []
+    for phrases in doc_tokens:
+        vectors = []
+        for tokens in phrases:
+            counts = defaultdict(int)
+            for term in tokens:
+                counts[term] += 1
+            weights = [(1 + math.log(count)) * idf[term] for term, count in counts.items()]
+            norm = math.sqrt(sum(weight * weight for weight in weights))
+            if norm:
+                vectors.append((tuple(counts), array('d', [weight / norm for weight in weights])))
+            else:
+                vectors.append(EMPTY_TOPIC_VECTOR)
+        doc_vectors.append(vectors)
+    
+    return doc_vectors
+
+def topic_postings(vectors, cols=None):
+    """Inverted index over phrase vectors: term -> (cols, weights) arrays."""
+    postings = {}
+    for col in (range(len(vectors)) if cols is None else cols):
+        terms, weights = vectors[col]
+        for term, weight in zip(terms, weights):
+            posting = postings.get(term)
+            if posting is None:
+                posting = postings[term] = (array('l'), array('d'))
+            posting[0].append(col)
+            posting[1].append(weight)
+    return postings
+
+def topic_aligned_cols(vector, postings, threshold):
+    scores = defaultdict(float)
+    terms, weights = vector
+    for term, weight in zip(terms, weights):
+        posting = postings.get(term)
+        if posting is not None:
+            for col, other_weight in zip(*posting):
+                scores[col] += weight * other_weight
+    return [col for col in sorted(scores) if scores[col] >= threshold]
+
+def iter_topic_aligned_rows(vectors_i, vectors_j, threshold, rows=None, cols=None):
+    """Compute the sparse product of two phrase-vector sets through an
+    inverted index, yielding (row, [cols]) for each row in order with the
+    columns whose cosine is >= threshold. rows/cols restrict which phrases
+    take part."""
+    postings = topic_postings(vectors_j, cols)
+    for row in (range(len(vectors_i)) if rows is None else rows):
+        yield row, topic_aligned_cols(vectors_i[row], postings, threshold)
+
+def topic_aligned_pairs(vectors_i, vectors_j, threshold, rows=None, cols=None):
+    return [(row, col) for row, matched in iter_topic_aligned_rows(vectors_i, vectors_j, threshold, rows, cols)
+            for col in matched]
+
+def matched_sections(sections_i, sections_j, titles_i, titles_j, bodies_i, bodies_j, budget):
+    """Map each section of one document to the similar sections of another.
+
+    Sections match on similar titles, or on clearly similar bodies when the
+    titles differ ("Leave Application" vs "Vacation Policy"). A document
+    without headings has a single section and is matched against everything,
+    so unstructured text falls back to whole-document comparison. Stops with
+    the matches found so far when the budget runs out of time.
+    """
+    if len(sections_i) == 1 or len(sections_j) == 1:
+        return {a: list(range(len(sections_j))) for a in range(len(sections_i))}
+    
+    matches = defaultdict(set)
+    for vectors_i, vectors_j, threshold in ((titles_i, titles_j, SECTION_SIMILARITY_THRESHOLD),
+                                            (bodies_i, bodies_j, SECTION_BODY_SIMILARITY_THRESHOLD)):
+        for a, matched in iter_topic_aligned_rows(vectors_i, vectors_j, threshold):
+            if budget.out_of_time():
+                return matches
+            budget.sections_compared += 1
+            matches[a].update(matched)
+    return matches
+
+class DetectionBudget:
+    """Per-request limits on how much work contradiction detection may do.
+
+    When the wall-time or pair limit runs out the detector stops and returns
+    what it has found so far; the budget records why and how much was left.
+    Phrases beyond max_phrases_per_doc are dropped up front, and a document
+    with more than max_sections_per_doc sections is compared as a whole.
+    """
+    
+    def __init__(self, max_seconds=None, max_pairs=None, max_phrases_per_doc=None, max_sections_per_doc=None):
+        self.max_seconds = max_seconds
+        self.max_pairs = max_pairs
+        self.max_phrases_per_doc = max_phrases_per_doc
+        self.max_sections_per_doc = max_sections_per_doc
+        self.started = time.monotonic()
+        self.stopped_by = None
+        self.pairs_compared = 0
+        self.phrases_unchecked = 0
+        self.phrases_truncated = 0
+        self.sections_compared = 0
+        self.documents_unsectioned = 0
+        self.document_pairs_total = 0
+        self.document_pairs_completed = 0
+    
+    @classmethod
+    def for_tier(cls, subscription_type):
+        return cls(**DETECTION_BUDGETS.get(subscription_type, DETECTION_BUDGETS['free']))
+    
+    @property
+    def partial(self):
+        # Comparing a document as a whole also depends on the tier's limits,
+        # so such results are reported as partial and never cached
+        return self.stopped_by is not None or self.phrases_truncated > 0 or self.documents_unsectioned > 0
+    
+    def limit_phrases(self, phrases):
+        if self.max_phrases_per_doc is None or len(phrases) <= self.max_phrases_per_doc:
+            return phrases
+        self.phrases_truncated += len(phrases) - self.max_phrases_per_doc
+        return phrases[:self.max_phrases_per_doc]
+    
+    def limit_sections(self, sections):
+        # Matching sections costs a title and a body product per document
+        # pair, so very fragmented text (e.g. OCR output) is not split up
+        if self.max_sections_per_doc is None or len(sections) <= self.max_sections_per_doc:
+            return sections
+        self.documents_unsectioned += 1
+        return [Section('', 0, (), [line for section in sections for line in section.lines])]
+    
+    def out_of_time(self):
+        if self.stopped_by is None and self.max_seconds is not None \
+                and time.monotonic() - self.started >= self.max_seconds:
+            self.stopped_by = 'time'
+        return self.stopped_by is not None
+    
+    def take_pair(self):
+        if self.stopped_by is not None:
+            return False
+        if self.max_pairs is not None and self.pairs_compared >= self.max_pairs:
+            self.stopped_by = 'pairs'
+            return False
+        self.pairs_compared += 1
+        if not self.pairs_compared % 256:
+            self.out_of_time()
+        return True
+    
+    def summary(self):
+        return {
+            'partial': self.partial,
+            'stopped_by': self.stopped_by,
+            'elapsed_seconds': round(time.monotonic() - self.started, 3),
+            'pairs_compared': self.pairs_compared,
+            'phrases_unchecked': self.phrases_unchecked,
+            'document_pairs_completed': self.document_pairs_completed,
+            'document_pairs_remaining': self.document_pairs_total - self.document_pairs_completed,
+            'phrases_truncated': self.phrases_truncated,
+            'sections_compared': self.sections_compared,
+            'documents_unsectioned': self.documents_unsectioned,
+            'limits': {
+                'max_seconds': self.max_seconds,
+                'max_pairs': self.max_pairs,
+                'max_phrases_per_doc': self.max_phrases_per_doc,
+                'max_sections_per_doc': self.max_sections_per_doc
             }
+        }
+
+# Fact sweep
+# Within a matched section group the other document's numeric facts are
+# kept per (fact, bound) in arrays sorted by value, so the phrases a fact
+# conflicts with (see numeric_conflict) are contiguous ranges found by
+# bisection. The ranges ignore calendar_slack(), so they can include pairs
+# the rules then find to agree, but never miss a conflict. A phrase whose values all agree with the other document is
+# skipped without any topic scoring; otherwise whichever is smaller, its
+# conflicting ranges or its topic product, is checked for aligned pairs.
+# Only rules registered with sweep=True are run on these pairs; other rules
+# get every topic-aligned pair.
+class SortedFacts:
+    __slots__ = ('values', 'phrases')
+    
+    def __init__(self, entries):
+        entries.sort()
+        self.values = array('d', [value for value, _ in entries])
+        self.phrases = array('l', [phrase for _, phrase in entries])
+
+def index_numeric_facts(doc_facts, phrases):
+    entries = defaultdict(list)
+    for phrase in phrases:
+        for name, fact in zip(FACT_EXTRACTORS, doc_facts[phrase].values):
+            if fact is not None:
+                entries[name, fact.bound].append((fact.value, phrase))
+    return {key: SortedFacts(group) for key, group in entries.items()}
+
+def conflicting_ranges(phrase_facts, index):
+    """Return (phrases, start, stop) slices of the index whose facts
+    conflict with phrase_facts. A phrase may appear in more than one."""
+    ranges = []
+    for name, fact in zip(FACT_EXTRACTORS, phrase_facts.values):
+        if fact is None:
+            continue
+        for bound in BOUND_WORDS:
+            sorted_facts = index.get((name, bound))
+            if sorted_facts is None:
+                continue
+            values, phrases = sorted_facts.values, sorted_facts.phrases
+            if bound == fact.bound:
+                # Same kind of requirement: every other value conflicts
+                below, above = bisect_left(values, fact.value), bisect_right(values, fact.value)
+            else:
+                # Lower bounds conflict above fact.high, upper bounds below fact.low
+                below = 0 if bound == 'min' else bisect_left(values, fact.low)
+                above = len(values) if bound == 'max' else bisect_right(values, fact.high)
+            if below:
+                ranges.append((phrases, 0, below))
+            if above < len(values):
+                ranges.append((phrases, above, len(values)))
+    return ranges
+
+def _budgeted_pairs(facts_i, facts_j, vectors_i, vectors_j, section_rows, budget):
+    """Yield topic-aligned phrase pairs whose facts conflict until the
+    budget runs out, recording how many candidate phrases were left
+    unchecked if it does."""
+    rows_left = sum(len(rows) for rows, _ in section_rows)
+    
+    for rows, cols in section_rows:
+        index = index_numeric_facts(facts_j, cols)
+        postings = topic_postings(vectors_j, cols)
+        for row in rows:
+            if budget.out_of_time():
+                budget.phrases_unchecked += rows_left
+                return
+            rows_left -= 1
+            
+            ranges = conflicting_ranges(facts_i[row], index)
+            conflicting = sum(stop - start for _, start, stop in ranges)
+            if not conflicting:
+                continue
+            
+            # Scoring a candidate directly touches about as many terms as
+            # the row has; the product touches every posting of its terms
+            terms, weights = vectors_i[row]
+            scoring_cost = sum(len(postings[term][0]) for term in terms if term in postings)
+            if conflicting * len(terms) <= scoring_cost:
+                row_weights = dict(zip(terms, weights))
+                candidates = sorted({col for phrases, start, stop in ranges for col in phrases[start:stop]})
+                matched = [col for col in candidates
+                           if sum(weight * row_weights.get(term, 0.0) for term, weight in zip(*vectors_j[col]))
+                           >= TOPIC_SIMILARITY_THRESHOLD]
+            else:
+                matched = topic_aligned_cols(vectors_i[row], postings, TOPIC_SIMILARITY_THRESHOLD)
+            
+            for col in matched:
+                if not budget.take_pair():
+                    budget.phrases_unchecked += rows_left + 1
+                    return
+                yield row, col
+
+def _budgeted_topic_pairs(vectors_i, vectors_j, section_rows, budget):
+    """Yield every topic-aligned phrase pair until the budget runs out."""
+    rows_left = sum(len(rows) for rows, _ in section_rows)
+    
+    for rows, cols in section_rows:
+        for row, matched in iter_topic_aligned_rows(vectors_i, vectors_j, TOPIC_SIMILARITY_THRESHOLD, rows, cols):
+            if budget.out_of_time():
+                budget.phrases_unchecked += rows_left
+                return
+            rows_left -= 1
+            
+            for col in matched:
+                if not budget.take_pair():
+                    budget.phrases_unchecked += rows_left + 1
+                    return
+                yield row, col
+
+def _section_rows(matches, candidates_i, candidates_j):
+    section_rows = []
+    for a in sorted(matches):
+        rows = candidates_i[a]
+        cols = sorted(n for b in matches[a] for n in candidates_j[b])
+        if rows and cols:
+            section_rows.append((rows, cols))
+    return section_rows
+
+def detect_contradictions_advanced(docs_data, budget=None):
+    budget = budget or DetectionBudget()
+    contradictions = []
+    seen_contradictions = set()
     
-    # Check for time period conflicts
-    time_keywords = ['days', 'weeks', 'months', 'notice', 'deadline', 'advance']
-    if any(keyword in p1_lower for keyword in time_keywords) and any(keyword in p2_lower for keyword in time_keywords):
-        time1 = re.search(r'(\d+)\s*(days?|weeks?|months?)', p1_lower)
-        time2 = re.search(r'(\d+)\s*(days?|weeks?|months?)', p2_lower)
+    doc_sections = [budget.limit_sections(doc.get('sections') or sections_from_text(doc['text'])) for doc in docs_data]
+    doc_phrases = []
+    phrase_sections = []
+    for sections in doc_sections:
+        phrases, owners = [], []
+        for index, section in enumerate(sections):
+            section_phrases = extract_key_phrases(section.text)
+            phrases.extend(section_phrases)
+            owners.extend([index] * len(section_phrases))
+        phrases = budget.limit_phrases(phrases)
+        doc_phrases.append(phrases)
+        phrase_sections.append(owners[:len(phrases)])
+    
+    # Phrases with the same lowercased text share a key, so a conflict is
+    # reported once however many documents repeat it
+    phrase_keys = {}
+    doc_facts = []
+    for phrases in doc_phrases:
+        phrase_facts = [extract_phrase_facts(phrase) for phrase in phrases]
+        for facts in phrase_facts:
+            if facts.rule_mask:
+                facts.key = phrase_keys.setdefault(facts.text.lower(), len(phrase_keys))
+        doc_facts.append(phrase_facts)
+    del phrase_keys  # holds a lowercased copy of every candidate phrase
+    
+    # A phrase's topic includes its own section heading
+    doc_vectors = build_topic_vectors([
+        [sections[owner].title + '\n' + phrase for phrase, owner in zip(phrases, owners)]
+        for phrases, owners, sections in zip(doc_phrases, phrase_sections, doc_sections)
+    ])
+    
+    section_titles = build_topic_vectors([[section.title for section in sections] for sections in doc_sections])
+    section_bodies = build_topic_vectors([[section.text for section in sections] for sections in doc_sections])
+    
+    # Phrases no rule can apply to never need to be paired; sweep rules and
+    # the other rules get separate candidate lists
+    sweep_candidates, topic_candidates = [], []
+    for phrase_facts, owners, sections in zip(doc_facts, phrase_sections, doc_sections):
+        sweep, topic = [[] for _ in sections], [[] for _ in sections]
+        for n, facts in enumerate(phrase_facts):
+            if facts.rule_mask & SWEEP_RULE_MASK:
+                sweep[owners[n]].append(n)
+            if facts.rule_mask & ~SWEEP_RULE_MASK:
+                topic[owners[n]].append(n)
+        sweep_candidates.append(sweep)
+        topic_candidates.append(topic)
+    
+    doc_pairs = [(i, j) for i in range(len(doc_facts)) for j in range(i + 1, len(doc_facts))]
+    budget.document_pairs_total = len(doc_pairs)
+    
+    for i, j in doc_pairs:
+        if budget.out_of_time() or len(contradictions) >= MAX_CONTRADICTIONS:
+            break
         
-        if time1 and time2:
-            val1, unit1 = int(time1.group(1)), time1.group(2)
-            val2, unit2 = int(time2.group(1)), time2.group(2)
+        matches = matched_sections(doc_sections[i], doc_sections[j], section_titles[i], section_titles[j],
+                                   section_bodies[i], section_bodies[j], budget)
+        sweep_pairs = _budgeted_pairs(doc_facts[i], doc_facts[j], doc_vectors[i], doc_vectors[j],
+                                      _section_rows(matches, sweep_candidates[i], sweep_candidates[j]), budget)
+        topic_pairs = _budgeted_topic_pairs(doc_vectors[i], doc_vectors[j],
+                                            _section_rows(matches, topic_candidates[i], topic_candidates[j]), budget)
+        candidate_pairs = chain(((a, b, SWEEP_RULE_MASK) for a, b in sweep_pairs),
+                                ((a, b, ~SWEEP_RULE_MASK) for a, b in topic_pairs))
+        
+        for a, b, rules in candidate_pairs:
+            if len(contradictions) >= MAX_CONTRADICTIONS:
+                break
             
-            if unit1 == unit2 and val1 != val2:
-                severity = "High" if abs(val1 - val2) >= 7 else "Medium"
-                return {
-                    'type': 'Time Period Conflict',
-                    'explanation': f'Conflicting time requirements found: {val1} {unit1} vs {val2} {unit2}. This could lead to confusion about actual deadlines.',
-                    'suggestion': f'Establish a single, clear time requirement. Recommend using {max(val1, val2)} {unit1} to ensure adequate time for compliance.',
-                    'severity': severity
-                }
+            fact_i = doc_facts[i][a]
+            fact_j = doc_facts[j][b]
+            if not fact_i.rule_mask & fact_j.rule_mask & rules:
+                continue
+            
+            contradiction_key = (fact_i.key, fact_j.key) if fact_i.key < fact_j.key else (fact_j.key, fact_i.key)
+            if contradiction_key in seen_contradictions:
+                continue
+            
+            contradiction = run_contradiction_rules(fact_i, fact_j, rules)
+            if contradiction:
+                seen_contradictions.add(contradiction_key)
+                contradictions.append(ContradictionHit(i, j, fact_i, fact_j, contradiction))
+        
+        if budget.stopped_by is None:
+            budget.document_pairs_completed += 1
     
-    return None
+    return contradictions
+
+def analyze_contradiction(phrase1, phrase2):
+    return run_contradiction_rules(extract_phrase_facts(phrase1), extract_phrase_facts(phrase2))
 
 @app.route('/upload', methods=['POST'])
 @require_auth
+@admission_controlled
 def upload_files():
     user_id = request.current_user_id
     files = request.files.getlist('files')
@@ -740,35 +2110,58 @@ def upload_files():
             'message': f'You need ${required_cost:.2f} but only have ${account_balance:.2f}. Please add funds to continue.'
         }), 402
     
+    uploads = []
+    for file in files:
+        content = file.read()
+        uploads.append((file.filename, content, document_hash(file.filename, content)))
+    
+    # Identical document sets reuse a complete earlier result
+    key = analysis_key([content_hash for _, _, content_hash in uploads])
+    cached = result_cache.get(key)
+    texts = dict(cached['texts']) if cached else {}
+    
     results = []
     valid_docs = []
     
     # Process each file
-    for file in files:
-        file_stream = io.BytesIO(file.read())
-        text = extract_text_from_file(file_stream, file.filename)
+    for filename, content, content_hash in uploads:
+        if content_hash in texts:
+            document = {'text': texts[content_hash], 'sections': None}
+        else:
+            document = extract_document(io.BytesIO(content), filename)
+            texts[content_hash] = document['text']
+        text = document['text']
         
-        file_data = {'filename': file.filename, 'text': text}
+        file_data = {'filename': filename, 'text': text}
         results.append(file_data)
         
         if not text.startswith('Error') and text != 'Unsupported file type':
-            valid_docs.append(file_data)
+            valid_docs.append(dict(file_data, sections=document['sections'], content_hash=content_hash))
     
-    # Detect contradictions
-    contradictions = []
-    if len(valid_docs) > 1:
-        contradictions = detect_contradictions_advanced(valid_docs)
+    budget = DetectionBudget.for_tier(get_subscription_type(user_id))
+    if cached:
+        doc_hashes, hits = cached['doc_hashes'], cached['contradictions']
+    else:
+        # Detect contradictions within the user's tier budget. Documents are
+        # ordered by content hash so the result depends only on the cache key.
+        hashed_docs = sorted(valid_docs, key=lambda doc: doc['content_hash'])
+        doc_hashes = [doc['content_hash'] for doc in hashed_docs]
+        hits = detect_contradictions_advanced(hashed_docs, budget) if len(hashed_docs) > 1 else []
     
-    # Update billing and deduct from account balance
-    billing_info = update_user_billing(user_id, len(valid_docs))
+    filenames = {}
+    for doc in valid_docs:
+        filenames.setdefault(doc['content_hash'], doc['filename'])
+    contradictions = serialize_contradictions(hits, [filenames[content_hash] for content_hash in doc_hashes])
     
-    # Deduct from account balance
-    conn = sqlite3.connect(DATABASE_PATH)
-    c = conn.cursor()
-    c.execute('UPDATE users SET account_balance = account_balance - ? WHERE id = ?',
-              (billing_info['documents_cost'], user_id))
-    conn.commit()
-    conn.close()
+    # Cached only once serialized, so every cached hit already has its id
+    if not cached and not budget.partial:
+        result_cache.put(key, texts, doc_hashes, hits)
+    
+    # Update billing and deduct from account balance
+    price_factor = RESULT_CACHE_HIT_PRICE_FACTOR if cached else 1.0
+    billing_info = update_user_billing(user_id, len(valid_docs), price_factor=price_factor, cache_hit=bool(cached))
+    billing_info['cache_hit'] = bool(cached)
+    billing_info['price_factor'] = price_factor
     
     # Get updated usage stats
     usage_stats = get_user_usage(user_id)
@@ -777,34 +2170,52 @@ def upload_files():
         'total_files': len(files),
         'valid_files': len(valid_docs),
         'contradictions_found': len(contradictions),
-        'processing_time': datetime.now().isoformat()
+        'processing_time': datetime.now().isoformat(),
+        'partial': budget.partial,
+        'detection_budget': budget.summary(),
+        'cache_hit': bool(cached),
+        'analysis_key': None if budget.partial else key
     }
     
-    response = {
+    response = jsonify({
         'files': results,
-        'contradictions': [
-            {
-                'id': c.id,
-                'doc1_name': c.doc1_name,
-                'doc2_name': c.doc2_name,
-                'doc1_text': c.doc1_text,
-                'doc2_text': c.doc2_text,
-                'type': c.conflict_type,
-                'explanation': c.explanation,
-                'suggestion': c.suggestion,
-                'severity': c.severity
-            } for c in contradictions
-        ],
+        'contradictions': contradictions,
         'analysis_summary': analysis_summary,
         'billing': billing_info,
         'usage_stats': usage_stats,
         'account_balance': get_account_balance(user_id)
-    }
+    })
     
-    return jsonify(response)
+    # Only complete results get a validator the client can revalidate later.
+    # It is weak: the contradictions are fixed by the key, but billing and
+    # usage figures in the same body change on every call.
+    if not budget.partial:
+        response.set_etag(key, weak=True)
+    return response
+
+@app.route('/analysis/<key>', methods=['GET'])
+@require_auth
+def revalidate_analysis(key):
+    # 304 while the client's result (If-None-Match: analysis key) is still
+    # what the current detector would produce; current: false once it is not.
+    # "current" means the same detector version only, since the key is a
+    # digest of the documents and need not still be in result_cache.
+    if not is_analysis_key(key):
+        return jsonify({'error': 'Invalid analysis key'}), 400
+    
+    if not analysis_key_is_current(key):
+        return jsonify({'analysis_key': key, 'current': False})
+    
+    if request.if_none_match.contains_weak(key):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify({'analysis_key': key, 'current': True})
+    response.set_etag(key)
+    return response
 
 @app.route('/generate-report', methods=['POST'])
 @require_auth
+@admission_controlled
 def generate_detailed_report():
     user_id = request.current_user_id
     data = request.get_json()
@@ -824,13 +2235,6 @@ def generate_detailed_report():
     # Update billing and deduct from account balance
     billing_info = update_user_billing(user_id, 0, generate_report_flag=True)
     
-    conn = sqlite3.connect(DATABASE_PATH)
-    c = conn.cursor()
-    c.execute('UPDATE users SET account_balance = account_balance - ? WHERE id = ?',
-              (PRICING['per_report'], user_id))
-    conn.commit()
-    conn.close()
-    
     # Generate comprehensive report
     contradictions = data['contradictions']
     
@@ -0,0 +1,98 @@
+"""Benchmark the numeric fact sweep against pairwise checks of topic-aligned pairs.
+
+Generates handbooks that mostly agree (a --conflict-rate share of clauses
+use a different value), then for growing sizes runs detection twice: once
+checking the rules on every topic-aligned phrase pair and once with the
+sorted-array fact sweep, reporting pairs handed to the rules and time.
+
+    python bench_fact_sweep.py --docs 4 --sentences 250 500 1000 2000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+CLAUSES = [
+    ('Leave requests', 'must be submitted at least {n} days in advance', [5, 7, 10]),
+    ('Termination', 'requires {n} weeks written notice', [2, 4, 6]),
+    ('Attendance', 'must be maintained at a minimum of {n}% throughout the year', [75, 80, 85]),
+    ('Safety training', 'must be completed within {n} days of joining', [14, 30, 45]),
+    ('Expense reports', 'must be filed no more than {n} days after purchase', [10, 14, 30]),
+    ('Probation', 'shall not exceed {n} months', [3, 6, 9]),
+    ('Bonus payments', 'are capped at {n} percent of salary', [10, 15, 20]),
+    ('Records', 'are retained for {n} years', [3, 5, 7]),
+]
+GROUPS = ['permanent staff', 'contractors', 'the engineering department', 'interns', 'managers']
+
+
+def make_document(rng, sentences, conflict_rate, flat=False):
+    """A handbook with one section per subject, or run-on text with flat=True."""
+    sections = {subject: [] for subject, _, _ in CLAUSES}
+    for _ in range(sentences):
+        subject, clause, values = rng.choice(CLAUSES)
+        value = rng.choice(values[1:]) if rng.random() < conflict_rate else values[0]
+        sections[subject].append(f'{subject} {clause.format(n=value)} for {rng.choice(GROUPS)}.')
+    if flat:
+        return ' '.join(rng.sample([line for lines in sections.values() for line in lines], sentences))
+    return '\n'.join(f'{subject.title()}\n' + '\n'.join(lines) for subject, lines in sections.items())
+
+
+def pairwise_detect(app, docs):
+    """Detection with the sweep replaced by rule checks on every topic-aligned pair."""
+    def topic_aligned(facts_i, facts_j, vectors_i, vectors_j, section_rows, budget):
+        for rows, cols in section_rows:
+            for row, matched in app.iter_topic_aligned_rows(vectors_i, vectors_j, app.TOPIC_SIMILARITY_THRESHOLD,
+                                                            rows, cols):
+                for col in matched:
+                    budget.take_pair()
+                    yield row, col
+
+    sweep = app._budgeted_pairs
+    app._budgeted_pairs = topic_aligned
+    try:
+        return timed_detect(app, docs)
+    finally:
+        app._budgeted_pairs = sweep
+
+
+def timed_detect(app, docs):
+    budget = app.DetectionBudget()
+    start = time.perf_counter()
+    conflicts = app.detect_contradictions_advanced(docs, budget)
+    return len(conflicts), budget.pairs_compared, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=4)
+    parser.add_argument('--sentences', type=int, nargs='+', default=[250, 500, 1000, 2000])
+    parser.add_argument('--conflict-rate', type=float, default=0.02)
+    parser.add_argument('--flat', action='store_true', help='no section headings')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(prefix='fact-sweep-bench-'), 'bench.db'))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app
+
+    # Count every conflict so the sweep's full cost is measured
+    app.MAX_CONTRADICTIONS = float('inf')
+
+    print(f'{"phrases/doc":>12}{"pairwise":>12}{"pairwise s":>12}{"sweep":>10}{"sweep s":>10}{"conflicts":>11}')
+    for sentences in args.sentences:
+        rng = random.Random(args.seed)
+        docs = [{'filename': f'doc_{n}.txt', 'text': make_document(rng, sentences, args.conflict_rate, args.flat)}
+                for n in range(args.docs)]
+
+        pairwise_conflicts, pairwise_pairs, pairwise_time = pairwise_detect(app, docs)
+        conflicts, sweep_pairs, sweep_time = timed_detect(app, docs)
+        assert conflicts == pairwise_conflicts, (conflicts, pairwise_conflicts)
+
+        print(f'{sentences:>12}{pairwise_pairs:>12}{pairwise_time:>12.2f}{sweep_pairs:>10}{sweep_time:>10.2f}'
+              f'{conflicts:>11}')
+
+
+if __name__ == '__main__':
+    main()
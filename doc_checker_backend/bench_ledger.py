@@ -0,0 +1,104 @@
+"""Load benchmark for the billing ledger writer.
+
+Runs concurrent update_user_billing() calls against a scratch database, once
+with one commit per request and once with group commits, and reports write
+throughput, commits issued and p50/p99 latency.
+
+    python bench_ledger.py --threads 32 --events 200
+"""
+import argparse
+import os
+import sqlite3
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run(app, writer, threads, events_per_thread, users):
+    app.ledger_writer = writer
+    latencies = []
+    latencies_lock = threading.Lock()
+    errors = []
+
+    def worker(index):
+        user_id = users[index % len(users)]
+        local = []
+        for n in range(events_per_thread):
+            start = time.perf_counter()
+            try:
+                app.update_user_billing(user_id, 1 + n % 3, generate_report_flag=(n % 10 == 0))
+            except Exception as e:
+                errors.append(e)
+            local.append(time.perf_counter() - start)
+        with latencies_lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    elapsed = time.perf_counter() - start
+
+    stats = writer.stats()
+    return {
+        'events': len(latencies),
+        'errors': len(errors),
+        'commits': stats['commits'],
+        'elapsed': elapsed,
+        'throughput': len(latencies) / elapsed,
+        'p50_ms': statistics.median(latencies) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=32)
+    parser.add_argument('--events', type=int, default=100, help='billing events per thread')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    parser.add_argument('--max-batch', type=int, default=64)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='ledger-bench-')
+    db_path = os.path.join(workdir, 'bench.db')
+    os.environ['DATABASE_PATH'] = db_path
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app
+
+    conn = sqlite3.connect(db_path)
+    users = []
+    for i in range(args.users):
+        c = conn.execute('INSERT INTO users (username, email, password_hash, account_balance) VALUES (?, ?, ?, ?)',
+                         (f'bench{i}', f'bench{i}@example.com', 'x', 1e9))
+        users.append(c.lastrowid)
+    conn.commit()
+    conn.close()
+    for user_id in users:
+        app.create_user_session(user_id)
+
+    modes = [
+        ('per-request commit', app.LedgerWriter(db_path, enabled=False)),
+        ('group commit', app.LedgerWriter(db_path, args.max_wait_ms, args.max_batch))
+    ]
+
+    print(f'{args.threads} threads x {args.events} events, {args.users} users, db={db_path}')
+    print(f'{"mode":<20}{"events/s":>10}{"commits":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+    for name, writer in modes:
+        result = run(app, writer, args.threads, args.events, users)
+        print(f'{name:<20}{result["throughput"]:>10.0f}{result["commits"]:>10}'
+              f'{result["p50_ms"]:>10.1f}{result["p99_ms"]:>10.1f}{result["errors"]:>8}')
+
+
+if __name__ == '__main__':
+    main()
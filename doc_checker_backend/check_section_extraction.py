@@ -0,0 +1,54 @@
+"""Check that section-aware detection still finds clauses written as headings.
+
+Builds pairs of handbook-style documents whose conflicting clauses are lines
+the heading heuristics also accept (numbered clauses without a final period
+and ALL-CAPS requirements) and asserts detection reports every conflict,
+whether the clauses sit under Title Case section headings or not.
+
+    python check_section_extraction.py
+"""
+import os
+import sys
+import tempfile
+
+HANDBOOKS = [
+    ('numbered clauses',
+     '1.1 All leave requests must be submitted {leave} days in advance\n'
+     '1.2 Expense reports must be filed within {expenses} days of purchase',
+     {'leave': (5, 10), 'expenses': (14, 30)}),
+    ('all-caps requirements',
+     'Attendance Policy\n'
+     'STAFF MUST MAINTAIN {attendance}% ATTENDANCE\n'
+     'Leave Application\n'
+     'Leave requests are reviewed by the line manager.\n'
+     'LEAVE MUST BE REQUESTED {leave} DAYS IN ADVANCE',
+     {'attendance': (80, 75), 'leave': (5, 7)}),
+    ('numbered clauses under headings',
+     'Team Standards:\n'
+     'Meetings:\n'
+     '2.1 Staff must attend at least {meetings}% of scheduled meetings\n'
+     'Working Hours\n'
+     '3.1 Expense reports must be filed within {expenses} days',
+     {'meetings': (90, 70), 'expenses': (14, 30)}),
+]
+
+
+def main():
+    os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(prefix='section-check-'), 'check.db'))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app
+
+    failed = False
+    for name, template, values in HANDBOOKS:
+        docs = [{'filename': f'doc_{n}.txt', 'text': template.format(**{key: pair[n] for key, pair in values.items()})}
+                for n in range(2)]
+        found = len(app.detect_contradictions_advanced(docs))
+        status = 'ok' if found == len(values) else 'FAIL'
+        failed |= status != 'ok'
+        print(f'{name:<34}{found:>3} of {len(values)} conflicts  {status}')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,9 @@
+# Gunicorn picks this file up from the working directory.
+# Threaded workers let admission control queue expensive requests while
+# keeping ADMISSION_RESERVED_THREADS free for lightweight routes.
+import os
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+worker_class = 'gthread'
+timeout = 120
@@ -0,0 +1,316 @@
+"""End-to-end load harness for the Flask API.
+
+Starts the app on a scratch database (Flask dev server or gunicorn), registers
+synthetic users, drives a weighted mix of routes and reports throughput and
+p50/p95/p99 latency per route, plus any SQLite lock errors seen in responses
+or in the server log.
+
+    python load_test.py --server gunicorn --workers 4 --concurrency 32 --duration 30
+    python load_test.py --rate 50 --stub-stripe --mix upload=4,usage-stats=3,profile=2,payment=1
+
+With --rate the load is open-loop (Poisson arrivals) and latency is measured
+from each request's scheduled arrival, so queueing in the client counts
+against the server. Without it each worker issues requests back to back.
+--stub-stripe starts mock_stripe_server.py and adds the payment flow
+(create-payment-intent, mock confirm + webhook, confirm-payment) to the mix.
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+WEBHOOK_SECRET = 'whsec_load_test'
+DEFAULT_MIX = 'upload=4,generate-report=1,usage-stats=3,profile=2'
+
+SAMPLE_CLAUSES = [
+    'All employees must maintain a minimum of {n}% attendance throughout the year',
+    'Leave requests must be submitted at least {n} days in advance',
+    'Either party may terminate by providing {n} days written notice',
+    'Expense reports must be filed within {n} days of purchase',
+    'Remote work is allowed up to {n} days per month with manager approval',
+    'The probation period shall not exceed {n} months',
+    'Employees are required to complete {n} hours of training each year',
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f'{url} did not come up within {timeout}s')
+
+
+def parse_mix(spec):
+    mix = {}
+    for item in spec.split(','):
+        route, _, weight = item.partition('=')
+        mix[route.strip()] = float(weight or 1)
+    return mix
+
+
+def percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def make_document(rng, clauses=12):
+    lines = [rng.choice(SAMPLE_CLAUSES).format(n=rng.choice([3, 5, 7, 10, 14, 30, 60, 75, 80, 90]))
+             for _ in range(clauses)]
+    return '. '.join(lines) + '.'
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+        self.lock_errors = 0
+
+    def record(self, route, latency, status, body=''):
+        with self.lock:
+            self.latencies[route].append(latency)
+            self.statuses[route][status] += 1
+            if 'database is locked' in body:
+                self.lock_errors += 1
+
+
+class Harness:
+    def __init__(self, args):
+        self.args = args
+        self.stats = Stats()
+        self.users = []
+        self.processes = []
+        self.rng = random.Random(args.seed)
+        self.rng_lock = threading.Lock()
+        self.workdir = tempfile.mkdtemp(prefix='doc-checker-load-')
+        self.db_path = os.path.join(self.workdir, 'load.db')
+        self.server_log = os.path.join(self.workdir, 'server.log')
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency * 2)
+        self.session.mount('http://', adapter)
+
+    # Process management
+
+    def start(self):
+        port = self.args.port or free_port()
+        self.base_url = f'http://127.0.0.1:{port}'
+        env = dict(os.environ, DATABASE_PATH=self.db_path, PORT=str(port), FLASK_ENV='production',
+                   STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+
+        if self.args.stub_stripe:
+            stripe_port = free_port()
+            self.stripe_url = f'http://127.0.0.1:{stripe_port}'
+            env['STRIPE_API_BASE'] = self.stripe_url
+            stripe_env = dict(env, MOCK_STRIPE_PORT=str(stripe_port),
+                              MOCK_STRIPE_WEBHOOK_URL=f'{self.base_url}/stripe-webhook')
+            self._spawn([sys.executable, os.path.join(BACKEND_DIR, 'mock_stripe_server.py')], stripe_env)
+            wait_for(self.stripe_url + '/v1/payment_intents/none')
+
+        if self.args.server == 'gunicorn':
+            env['GUNICORN_THREADS'] = str(self.args.threads)
+            command = ['gunicorn', '-w', str(self.args.workers), '--threads', str(self.args.threads),
+                       '--pythonpath', BACKEND_DIR, '-b', f'127.0.0.1:{port}', 'app:app']
+        else:
+            command = [sys.executable, os.path.join(BACKEND_DIR, 'app.py')]
+        self._spawn(command, env)
+        wait_for(self.base_url + '/health')
+
+    def _spawn(self, command, env):
+        # Run from the scratch directory so generated reports stay out of the tree
+        log = open(self.server_log, 'a')
+        self.processes.append(subprocess.Popen(command, cwd=self.workdir, env=env, stdout=log, stderr=log))
+
+    def stop(self):
+        for process in self.processes:
+            process.terminate()
+        for process in self.processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    # Setup
+
+    def register_users(self):
+        run_id = uuid.uuid4().hex[:8]
+        for i in range(self.args.users):
+            response = self.session.post(f'{self.base_url}/register', json={
+                'username': f'load_{run_id}_{i}',
+                'email': f'load_{run_id}_{i}@example.com',
+                'password': 'load-test-password'
+            })
+            response.raise_for_status()
+            data = response.json()
+            self.users.append({'id': data['user']['id'], 'token': data['token']})
+
+        # Fund the synthetic accounts so billing never short-circuits with 402
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('UPDATE users SET account_balance = ?', (1e9,))
+        conn.commit()
+        conn.close()
+
+    # Workloads
+
+    def _headers(self, user):
+        return {'Authorization': f'Bearer {user["token"]}'}
+
+    def _call(self, route, method, url, started, **kwargs):
+        try:
+            response = self.session.request(method, url, timeout=self.args.timeout, **kwargs)
+            status, body = response.status_code, response.text
+        except requests.RequestException as e:
+            status, body = type(e).__name__, str(e)
+        self.stats.record(route, time.perf_counter() - started, status, body)
+        return status, body
+
+    def do_upload(self, user, started):
+        with self.rng_lock:
+            docs = [make_document(self.rng) for _ in range(self.rng.randint(2, self.args.docs))]
+        files = [('files', (f'doc_{n}.txt', text.encode('utf-8'), 'text/plain')) for n, text in enumerate(docs)]
+        self._call('upload', 'POST', f'{self.base_url}/upload', started,
+                   files=files, headers=self._headers(user))
+
+    def do_generate_report(self, user, started):
+        contradictions = [{'type': 'Time Period Conflict', 'severity': 'High', 'doc1_name': 'a.txt',
+                           'doc2_name': 'b.txt', 'suggestion': 'Align notice periods'}] * 3
+        self._call('generate-report', 'POST', f'{self.base_url}/generate-report', started,
+                   json={'contradictions': contradictions, 'docs_data': [{}, {}]}, headers=self._headers(user))
+
+    def do_usage_stats(self, user, started):
+        self._call('usage-stats', 'GET', f'{self.base_url}/usage-stats', started, headers=self._headers(user))
+
+    def do_profile(self, user, started):
+        self._call('profile', 'GET', f'{self.base_url}/profile', started, headers=self._headers(user))
+
+    def do_payment(self, user, started):
+        status, body = self._call('create-payment-intent', 'POST', f'{self.base_url}/create-payment-intent',
+                                  started, json={'amount': 10}, headers=self._headers(user))
+        if status != 200:
+            return
+        intent_id = json.loads(body)['payment_intent_id']
+        requests.post(f'{self.stripe_url}/v1/payment_intents/{intent_id}/confirm', timeout=self.args.timeout)
+        self._call('confirm-payment', 'POST', f'{self.base_url}/confirm-payment', time.perf_counter(),
+                   json={'payment_intent_id': intent_id}, headers=self._headers(user))
+
+    # Drivers
+
+    def pick(self, mix):
+        with self.rng_lock:
+            route = self.rng.choices(list(mix), weights=list(mix.values()))[0]
+            user = self.rng.choice(self.users)
+        return route, user
+
+    def dispatch(self, route, user, started):
+        handler = getattr(self, 'do_' + route.replace('-', '_'))
+        handler(user, started)
+
+    def run(self, mix):
+        deadline = time.perf_counter() + self.args.duration
+        start = time.perf_counter()
+
+        if self.args.rate:
+            with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+                next_arrival = time.perf_counter()
+                while next_arrival < deadline:
+                    delay = next_arrival - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+                    route, user = self.pick(mix)
+                    pool.submit(self.dispatch, route, user, next_arrival)
+                    with self.rng_lock:
+                        next_arrival += self.rng.expovariate(self.args.rate)
+        else:
+            def worker():
+                while time.perf_counter() < deadline:
+                    route, user = self.pick(mix)
+                    self.dispatch(route, user, time.perf_counter())
+
+            threads = [threading.Thread(target=worker) for _ in range(self.args.concurrency)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+
+        return time.perf_counter() - start
+
+    def report(self, elapsed):
+        print(f'\n{"route":<24}{"count":>7}{"req/s":>9}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}  statuses')
+        for route in sorted(self.stats.latencies):
+            ordered = sorted(self.stats.latencies[route])
+            statuses = ' '.join(f'{k}:{v}' for k, v in sorted(self.stats.statuses[route].items(), key=str))
+            print(f'{route:<24}{len(ordered):>7}{len(ordered) / elapsed:>9.1f}'
+                  f'{percentile(ordered, 50) * 1000:>9.1f}{percentile(ordered, 95) * 1000:>9.1f}'
+                  f'{percentile(ordered, 99) * 1000:>9.1f}  {statuses}')
+
+        total = sum(len(v) for v in self.stats.latencies.values())
+        with open(self.server_log, errors='replace') as f:
+            log_lock_errors = f.read().count('database is locked')
+        print(f'\ntotal {total} requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)')
+        print(f'SQLite lock errors: {self.stats.lock_errors} in responses, {log_lock_errors} in server log')
+        print(f'server log: {self.server_log}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server', choices=['dev', 'gunicorn'], default='dev')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker')
+    parser.add_argument('--port', type=int, default=0)
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--rate', type=float, default=0, help='open-loop arrival rate in req/s (0 = closed loop)')
+    parser.add_argument('--duration', type=float, default=20, help='seconds')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='route=weight pairs')
+    parser.add_argument('--docs', type=int, default=4, help='maximum documents per upload')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--stub-stripe', action='store_true', help='start mock_stripe_server.py for payment routes')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    if 'payment' in mix and not args.stub_stripe:
+        parser.error('the payment workload requires --stub-stripe')
+    if args.stub_stripe and 'payment' not in mix:
+        mix['payment'] = 1.0
+    unknown = [route for route in mix if not hasattr(Harness, 'do_' + route.replace('-', '_'))]
+    if unknown:
+        parser.error(f'unknown routes in --mix: {", ".join(unknown)}')
+
+    harness = Harness(args)
+    try:
+        harness.start()
+        harness.register_users()
+        print(f'{args.server} server at {harness.base_url}, {len(harness.users)} users, mix {mix}')
+        elapsed = harness.run(mix)
+        harness.report(elapsed)
+    finally:
+        harness.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Local stand-in for the parts of the Stripe API the backend uses.
+
+Run it next to the app and point the app at it:
+
+    STRIPE_WEBHOOK_SECRET=whsec_mock python mock_stripe_server.py
+    STRIPE_API_BASE=http://127.0.0.1:12111 STRIPE_WEBHOOK_SECRET=whsec_mock python app.py
+
+Confirming a PaymentIntent (POST /v1/payment_intents/<id>/confirm) marks it
+succeeded and delivers a signed ``payment_intent.succeeded`` event to
+MOCK_STRIPE_WEBHOOK_URL, the same way Stripe would.
+"""
+import hashlib
+import hmac
+import json
+import os
+import re
+import threading
+import time
+import uuid
+
+import requests
+from flask import Flask, jsonify, request
+
+app = Flask(__name__)
+
+WEBHOOK_SECRET = os.environ.get('STRIPE_WEBHOOK_SECRET', 'whsec_mock')
+WEBHOOK_URL = os.environ.get('MOCK_STRIPE_WEBHOOK_URL', 'http://127.0.0.1:5000/stripe-webhook')
+
+payment_intents = {}
+intents_lock = threading.Lock()
+
+
+def parse_form(form):
+    """Expand Stripe's ``metadata[key]=value`` form encoding into nested dicts."""
+    params = {}
+    for key, value in form.items():
+        match = re.match(r'^(\w+)\[(\w+)\]$', key)
+        if match:
+            params.setdefault(match.group(1), {})[match.group(2)] = value
+        else:
+            params[key] = value
+    return params
+
+
+def sign_payload(payload, secret, timestamp=None):
+    timestamp = timestamp or int(time.time())
+    signed = f'{timestamp}.{payload}'.encode('utf-8')
+    signature = hmac.new(secret.encode('utf-8'), signed, hashlib.sha256).hexdigest()
+    return f't={timestamp},v1={signature}'
+
+
+def deliver_event(event_type, obj):
+    event = {
+        'id': f'evt_mock_{uuid.uuid4().hex[:24]}',
+        'object': 'event',
+        'type': event_type,
+        'created': int(time.time()),
+        'data': {'object': obj}
+    }
+    payload = json.dumps(event)
+    headers = {
+        'Content-Type': 'application/json',
+        'Stripe-Signature': sign_payload(payload, WEBHOOK_SECRET)
+    }
+    response = requests.post(WEBHOOK_URL, data=payload, headers=headers, timeout=10)
+    return response.status_code
+
+
+def stripe_error(message, status=400):
+    return jsonify({'error': {'type': 'invalid_request_error', 'message': message}}), status
+
+
+@app.route('/v1/payment_intents', methods=['POST'])
+def create_payment_intent():
+    params = parse_form(request.form)
+    if 'amount' not in params:
+        return stripe_error('Missing required param: amount.')
+
+    intent_id = f'pi_mock_{uuid.uuid4().hex[:24]}'
+    intent = {
+        'id': intent_id,
+        'object': 'payment_intent',
+        'amount': int(params['amount']),
+        'currency': params.get('currency', 'usd'),
+        'metadata': params.get('metadata', {}),
+        'status': 'requires_payment_method',
+        'client_secret': f'{intent_id}_secret_{uuid.uuid4().hex[:16]}',
+        'created': int(time.time())
+    }
+    with intents_lock:
+        payment_intents[intent_id] = intent
+    return jsonify(intent)
+
+
+@app.route('/v1/payment_intents/<intent_id>', methods=['GET'])
+def retrieve_payment_intent(intent_id):
+    with intents_lock:
+        intent = payment_intents.get(intent_id)
+    if not intent:
+        return stripe_error(f"No such payment_intent: '{intent_id}'", 404)
+    return jsonify(intent)
+
+
+@app.route('/v1/payment_intents/<intent_id>/confirm', methods=['POST'])
+def confirm_payment_intent(intent_id):
+    with intents_lock:
+        intent = payment_intents.get(intent_id)
+        if not intent:
+            return stripe_error(f"No such payment_intent: '{intent_id}'", 404)
+        if intent['status'] == 'succeeded':
+            return stripe_error('This PaymentIntent has already succeeded.')
+        intent['status'] = 'succeeded'
+
+    deliver_event('payment_intent.succeeded', intent)
+    return jsonify(intent)
+
+
+@app.route('/_mock/payment_intents/<intent_id>/redeliver', methods=['POST'])
+def redeliver_webhook(intent_id):
+    """Send the succeeded event again, as Stripe does on retries."""
+    with intents_lock:
+        intent = payment_intents.get(intent_id)
+    if not intent or intent['status'] != 'succeeded':
+        return stripe_error('Only succeeded PaymentIntents can be redelivered.')
+
+    status = deliver_event('payment_intent.succeeded', intent)
+    return jsonify({'delivered': True, 'webhook_status': status})
+
+
+if __name__ == '__main__':
+    port = int(os.environ.get('MOCK_STRIPE_PORT', 12111))
+    app.run(host='127.0.0.1', port=port, threaded=True)
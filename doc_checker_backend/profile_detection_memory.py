@@ -0,0 +1,85 @@
+"""Memory profile of contradiction detection on a large synthetic corpus.
+
+Reports wall time, peak traced memory, memory still held by the results and
+garbage collections triggered, plus the top allocation sites live while the
+detector walks candidate pairs (phrase storage, facts and topic vectors) and
+after results are serialized.
+
+    python profile_detection_memory.py --docs 4 --sentences 3000 --max-results 100000
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+TOPICS = ['Leave requests', 'Termination notice', 'Attendance', 'Safety training', 'Expense reports',
+          'Remote work', 'Probation', 'Performance reviews', 'Overtime', 'Meeting attendance']
+CLAUSES = ['must be submitted at least {n} days in advance', 'requires {n} days written notice',
+           'must be kept above {n}% for the year', 'must be completed within {n} weeks of joining',
+           'are capped at {n} percent of salary', 'may not exceed {n} months']
+
+
+def make_document(rng, sentences):
+    return '. '.join(f'{rng.choice(TOPICS)} {rng.choice(CLAUSES).format(n=rng.randint(1, 99))} '
+                     f'for staff group {rng.randint(1, 50)}' for _ in range(sentences)) + '.'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--docs', type=int, default=4)
+    parser.add_argument('--sentences', type=int, default=3000)
+    parser.add_argument('--max-results', type=int, default=100000,
+                        help='raise the result limit so the hit path is exercised')
+    parser.add_argument('--top', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(prefix='memory-profile-'), 'profile.db'))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app
+
+    app.MAX_CONTRADICTIONS = args.max_results
+    rng = random.Random(args.seed)
+    docs = [{'filename': f'doc_{n}.txt', 'text': make_document(rng, args.sentences)} for n in range(args.docs)]
+
+    # Snapshot once, at the first rule call, when all phrase storage is live
+    snapshots = {}
+    run_rules = app.run_contradiction_rules
+
+    def run_rules_with_snapshot(*args):
+        if 'pair walk' not in snapshots:
+            snapshots['pair walk'] = (tracemalloc.take_snapshot(), tracemalloc.get_traced_memory()[0])
+        return run_rules(*args)
+
+    app.run_contradiction_rules = run_rules_with_snapshot
+
+    gc.collect()
+    collections_before = sum(stat['collections'] for stat in gc.get_stats())
+    tracemalloc.start(10)
+    start = time.perf_counter()
+
+    contradictions = app.detect_contradictions_advanced(docs)
+    serialized = app.serialize_contradictions(contradictions, [doc['filename'] for doc in docs])
+
+    elapsed = time.perf_counter() - start
+    current, peak = tracemalloc.get_traced_memory()
+    snapshots['serialized'] = (tracemalloc.take_snapshot(), current)
+    tracemalloc.stop()
+    collections = sum(stat['collections'] for stat in gc.get_stats()) - collections_before
+
+    print(f'{args.docs} docs x {args.sentences} sentences, {len(serialized)} contradictions')
+    print(f'time {elapsed:.2f}s  peak {peak / 1e6:.1f} MB  retained {current / 1e6:.1f} MB  gc runs {collections}')
+    for label, (snapshot, traced) in snapshots.items():
+        print(f'\n{label}: {traced / 1e6:.1f} MB live, top {args.top} allocation sites')
+        for stat in snapshot.statistics('lineno')[:args.top]:
+            frame = stat.traceback[0]
+            print(f'{stat.size / 1e6:>8.2f} MB {stat.count:>9} blocks  '
+                  f'{os.path.basename(frame.filename)}:{frame.lineno}')
+
+
+if __name__ == '__main__':
+    main()